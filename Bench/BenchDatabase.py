@@ -0,0 +1,121 @@
+'''
+Compare RecordClient against SQLiteClient on the same synthetic events: block commits while syncing,
+a cold reopen, leaf reads for building the Merkle tree and nullifier lookups.
+    python Bench/BenchDatabase.py --deposits 100000 --per-block 10
+'''
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hexbytes import HexBytes
+from web3.types import Wei
+
+import Database as DB
+import Log
+from Types import EventDeposit, EventWithdraw
+
+
+'''
+Make deposits with a withdraw for every 4th of them, grouped by block
+@return [(deposits, withdraws, block), ...]
+'''
+def Blocks(deposits: int, per_block: int, seed: int) -> list[tuple[list[EventDeposit], list[EventWithdraw], int]]:
+    rng   : random.Random                                             = random.Random(seed)
+    word  : Callable[[int], str]                                      = lambda n: '0x' + rng.randbytes(n).hex()
+    blocks: list[tuple[list[EventDeposit], list[EventWithdraw], int]] = []
+    for start in range(0, deposits, per_block):
+        block: int = 17000000 + start // per_block
+        blocks.append((
+            [EventDeposit(1700000000 + block, block, word(32), word(32), leaf) for leaf in range(start, min(start + per_block, deposits))],
+            [EventWithdraw(block, word(32), word(32), word(20), Wei(10 ** 15)) for _ in range(start // 4, min(start + per_block, deposits) // 4)],
+            block,
+        ))
+    return blocks
+
+
+'''
+@return Seconds of run and its result
+'''
+def Measure(run: Callable[[], Any]) -> tuple[float, Any]:
+    begin : float = time.perf_counter()
+    result: Any   = run()
+    return time.perf_counter() - begin, result
+
+
+'''
+Run every step on a new database of backend at url
+@return {step: (seconds, operations)}, and the leafs read back for comparison
+'''
+def Run(backend: DB.Backend, url: str, blocks: list[tuple[list[EventDeposit], list[EventWithdraw], int]], probes: list[bytes]) -> tuple[dict[str, tuple[float, int]], list[bytes]]:
+    steps    : dict[str, tuple[float, int]] = {}
+    deposits : int                          = sum(len(x[0]) for x in blocks)
+    withdraws: int                          = sum(len(x[1]) for x in blocks)
+
+    client: DB.InterfaceClient = DB.Factory.client(backend)
+    if not client.open(url):
+        Log.Print(f'Failed to open {backend.value} database at {url}')
+        sys.exit(1)
+    seconds, ok = Measure(lambda: all(client.commit(*x) for x in blocks))
+    if not ok:
+        Log.Print(f'Failed to commit blocks to {backend.value} database')
+        sys.exit(1)
+    steps['commit events'] = (seconds, deposits + withdraws)
+    client.close()
+
+    client = DB.Factory.client(backend)
+    seconds, ok = Measure(lambda: client.open(url))
+    if not ok:
+        Log.Print(f'Failed to reopen {backend.value} database at {url}')
+        sys.exit(1)
+    steps['reopen'] = (seconds, 1)
+    seconds, leafs = Measure(lambda: [leaf for chunk in client.iter_leafs(0, deposits - 1) for leaf in chunk])
+    steps['iter_leafs()'] = (seconds, len(leafs))
+    seconds, _ = Measure(lambda: [client.get_leafs(x, x + 99) for x in range(0, deposits, 100)])
+    steps['get_leafs() of 100'] = (seconds, deposits)
+    seconds, _ = Measure(lambda: [client.is_spent(x) for x in probes])
+    steps['is_spent()'] = (seconds, len(probes))
+    seconds, _ = Measure(lambda: client.are_spent(probes))
+    steps['are_spent()'] = (seconds, len(probes))
+    client.close()
+    return steps, [bytes(x) for x in leafs]
+
+
+def Main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description='Benchmark RecordClient against SQLiteClient')
+    parser.add_argument('--deposits', type=int, default=100000)
+    parser.add_argument('--per-block', type=int, default=10, help='Deposits committed per block')
+    parser.add_argument('--probes', type=int, default=10000, help='Nullifier lookups, half of them spent')
+    parser.add_argument('--seed', type=int, default=0)
+    args: argparse.Namespace = parser.parse_args()
+
+    Log.Init(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Tmp', 'Bench'), 'BenchDatabase')
+    blocks: list[tuple[list[EventDeposit], list[EventWithdraw], int]] = Blocks(args.deposits, args.per_block, args.seed)
+    spent : list[bytes]                                               = [bytes(HexBytes(w.nullifier_hash)) for x in blocks for w in x[1]]
+    rng   : random.Random                                             = random.Random(args.seed)
+    probes: list[bytes]                                               = [rng.choice(spent) if i % 2 else rng.randbytes(32) for i in range(args.probes)]
+
+    results: dict[DB.Backend, dict[str, tuple[float, int]]] = {}
+    leafs  : dict[DB.Backend, list[bytes]]                  = {}
+    with tempfile.TemporaryDirectory() as folder:
+        results[DB.Backend.SQLITE], leafs[DB.Backend.SQLITE] = Run(DB.Backend.SQLITE, os.path.join(folder, 'sqlite', 'events.db'), blocks, probes)
+        results[DB.Backend.RECORD], leafs[DB.Backend.RECORD] = Run(DB.Backend.RECORD, os.path.join(folder, 'record'), blocks, probes)
+    if leafs[DB.Backend.SQLITE] != leafs[DB.Backend.RECORD]:
+        Log.Print('Leafs of RecordClient do not match SQLiteClient')
+        sys.exit(1)
+
+    Log.Print(f'{args.deposits} deposits, {len(spent)} withdraws, {len(blocks)} blocks')
+    Log.Print(f'  {"":20} {"sqlite":>14} {"record":>14} {"speedup":>8}')
+    for step in results[DB.Backend.SQLITE]:
+        sqlite: tuple[float, int] = results[DB.Backend.SQLITE][step]
+        record: tuple[float, int] = results[DB.Backend.RECORD][step]
+        Log.Print(f'  {step:20} {sqlite[1] / sqlite[0]:10.0f} op/s {record[1] / record[0]:10.0f} op/s {sqlite[0] / record[0]:7.1f}x')
+
+
+if __name__ == '__main__':
+    Main()
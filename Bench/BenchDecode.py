@@ -0,0 +1,145 @@
+'''
+Decode throughput of Types.DecodeLogs() on get_logs responses.
+Record logs of a contract once, then benchmark offline:
+    python Bench/BenchDecode.py --record <rpc url> <contract> <from block> <to block> Tmp/logs.json
+    python Bench/BenchDecode.py Tmp/logs.json
+Without a file, synthetic logs shaped like Tornado Cash deposits and withdrawals are used.
+'''
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.types import LogReceipt, Wei
+
+import Log
+from Types import DecodeLog, DecodeLogs, EventDeposit, EventWithdraw, LogEvent
+
+
+'''
+Save logs of a contract in a block range to a JSON file
+'''
+def Record(url: str, contract: str, start: int, end: int, path: str) -> None:
+    w3  : Web3             = Web3(Web3.HTTPProvider(url))
+    logs: list[LogReceipt] = []
+    for block in range(start, end + 1, 1000):
+        logs += w3.eth.get_logs({
+            'address'  : Web3.to_checksum_address(contract),
+            'fromBlock': block,
+            'toBlock'  : min(block + 999, end),
+            'topics'   : [[EventDeposit.TOPIC, EventWithdraw.TOPIC]],
+        })
+    with open(path, 'w') as file:
+        file.write(Web3.to_json(logs))
+    Log.Print(f'Recorded {len(logs)} logs to {path}')
+
+
+'''
+Load logs saved by Record(), fields are typed as web3 returns them
+'''
+def Load(path: str) -> list[LogReceipt]:
+    with open(path) as file:
+        raw: list[dict] = json.load(file)
+    number: Callable[[int | str], int] = lambda x: x if isinstance(x, int) else int(x, 16)
+    return [{
+        'address'        : Web3.to_checksum_address(x['address']),
+        'topics'         : [HexBytes(topic) for topic in x['topics']],
+        'data'           : HexBytes(x['data']),
+        'blockNumber'    : number(x['blockNumber']),
+        'transactionHash': HexBytes(x['transactionHash']),
+        'logIndex'       : number(x['logIndex']),
+    } for x in raw]
+
+
+'''
+Make logs of 2 deposits for each withdraw
+'''
+def Synthesize(count: int) -> list[LogReceipt]:
+    logs: list[LogReceipt]       = []
+    word: Callable[[int], bytes] = lambda x: (x % 2 ** 256).to_bytes(32, byteorder='big')
+    for i in range(count):
+        if i % 3 < 2:
+            topics: list[HexBytes] = [EventDeposit.TOPIC, HexBytes(word(i * 7919))]
+            data  : HexBytes       = HexBytes(word(1700000000 + i) + word(i))
+        else:
+            topics: list[HexBytes] = [EventWithdraw.TOPIC]
+            data  : HexBytes       = HexBytes(word(i * 104729) + word(i * 7907) + word(10 ** 15))
+        logs.append({
+            'address'        : Web3.to_checksum_address('0x910cbd523d52c6e0d3ef5b87d1a4c8fb5b2f0a4b'),
+            'topics'         : topics,
+            'data'           : data,
+            'blockNumber'    : 17000000 + i // 4,
+            'transactionHash': HexBytes(word(i * 15485863)),
+            'logIndex'       : i % 4,
+        })
+    return logs
+
+
+'''
+Dispatch of EventPoller before the decoder registry, the topic hashes were computed for every log
+'''
+def Chained(logs: list[LogReceipt]) -> list[LogEvent | None]:
+    events: list[LogEvent | None] = []
+    for log in logs:
+        if Web3.keccak(text='Deposit(bytes32,uint32,uint256)') == log['topics'][0]:
+            events.append(EventDeposit(
+                int.from_bytes(log['data'][:32], byteorder='big'),
+                log['blockNumber'],
+                log['transactionHash'].to_0x_hex(),
+                log['topics'][1].to_0x_hex(),
+                int.from_bytes(log['data'][32:], byteorder='big')))
+        elif Web3.keccak(text='Withdrawal(address,bytes32,address,uint256)') == log['topics'][0]:
+            events.append(EventWithdraw(
+                log['blockNumber'],
+                log['transactionHash'].to_0x_hex(),
+                log['data'][32:64].to_0x_hex(),
+                log['data'][12:32].to_0x_hex(),
+                Wei(int.from_bytes(log['data'][64:], byteorder='big'))))
+        else:
+            events.append(None)
+    return events
+
+
+'''
+@return Logs per second, best of rounds
+'''
+def Measure(decode: Callable[[list[LogReceipt]], list[LogEvent | None]], logs: list[LogReceipt], rounds: int) -> float:
+    best: float = float('inf')
+    for _ in range(rounds):
+        begin: float = time.perf_counter()
+        decode(logs)
+        best = min(best, time.perf_counter() - begin)
+    return len(logs) / best
+
+
+def Main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description='Benchmark decoding of get_logs responses')
+    parser.add_argument('path', nargs='?', help='Logs recorded by --record, synthetic logs if omitted')
+    parser.add_argument('--record', nargs=4, metavar=('URL', 'CONTRACT', 'FROM', 'TO'), help='Record logs to path instead')
+    parser.add_argument('--count', type=int, default=100000, help='Number of synthetic logs')
+    parser.add_argument('--rounds', type=int, default=5)
+    args: argparse.Namespace = parser.parse_args()
+
+    Log.Init(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Tmp', 'Bench'), 'BenchDecode')
+    if args.record is not None:
+        Record(args.record[0], args.record[1], int(args.record[2]), int(args.record[3]), args.path)
+        return
+
+    logs: list[LogReceipt] = Synthesize(args.count) if args.path is None else Load(args.path)
+    if [None if x is None else x.__dict__() for x in DecodeLogs(logs)] != [None if x is None else x.__dict__() for x in Chained(logs)]:
+        Log.Print('DecodeLogs() does not match the chained dispatch')
+        sys.exit(1)
+    Log.Print(f'{len(logs)} logs, {args.path or "synthetic"}')
+    Log.Print(f'  if/elif chain : {Measure(Chained, logs, args.rounds):10.0f} logs/s')
+    Log.Print(f'  DecodeLog()   : {Measure(lambda x: [DecodeLog(log) for log in x], logs, args.rounds):10.0f} logs/s')
+    Log.Print(f'  DecodeLogs()  : {Measure(DecodeLogs, logs, args.rounds):10.0f} logs/s')
+
+
+if __name__ == '__main__':
+    Main()
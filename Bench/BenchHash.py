@@ -0,0 +1,52 @@
+'''
+Hashes per second of cpphash, merkle node pairs with poseidon() and poseidon_many(), Tornado commitments with pedersen().
+    python Bench/BenchHash.py --count 2000
+'''
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Any, Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hexbytes import HexBytes
+
+import Log
+from cpphash import FIELD_SIZE, cpphash
+
+
+'''
+@return Hashes per second, best of rounds
+'''
+def Measure(run: Callable[[], Any], count: int, rounds: int) -> float:
+    best: float = float('inf')
+    for _ in range(rounds):
+        begin: float = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - begin)
+    return count / best
+
+
+def Main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description='Benchmark Poseidon and Pedersen hashes')
+    parser.add_argument('--count', type=int, default=2000, help='Hashes per round')
+    parser.add_argument('--rounds', type=int, default=3)
+    args: argparse.Namespace = parser.parse_args()
+
+    Log.Init(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Tmp', 'Bench'), 'BenchHash')
+    rng  : random.Random                   = random.Random(0)
+    word : Callable[[], HexBytes]          = lambda: HexBytes(rng.randrange(FIELD_SIZE).to_bytes(32, byteorder='big'))
+    pairs: list[tuple[HexBytes, HexBytes]] = [(word(), word()) for _ in range(args.count)]
+    notes: list[list[HexBytes]]            = [[HexBytes(rng.randbytes(31)), HexBytes(rng.randbytes(31))] for _ in range(args.count)]  # Nullifier and secret
+    cpphash.pedersen(notes[0])  # Build or load the Pedersen tables before timing
+
+    Log.Print(f'{args.count} hashes, best of {args.rounds} rounds')
+    Log.Print(f'  poseidon() pair   : {Measure(lambda: [cpphash.poseidon(list(x)) for x in pairs], args.count, args.rounds):10.0f} hashes/s')
+    Log.Print(f'  poseidon_many()   : {Measure(lambda: cpphash.poseidon_many(pairs), args.count, args.rounds):10.0f} hashes/s')
+    Log.Print(f'  pedersen() 62 B   : {Measure(lambda: [cpphash.pedersen(x) for x in notes], args.count, args.rounds):10.0f} hashes/s')
+
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,65 @@
+'''
+Time of building a MerkleTree from leafs with repeated add() against one add_many(), as a cold start from the database does.
+    python Bench/BenchMerkleTree.py --count 1000 --height 20
+'''
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hexbytes import HexBytes
+
+import Log
+import MerkleTree
+
+
+'''
+Make random leafs inside the field
+'''
+def Leaves(count: int, seed: int) -> list[HexBytes]:
+    rng  : random.Random = random.Random(seed)
+    field: int           = int.from_bytes(MerkleTree.Interface.FILED_SIZE, byteorder='big')
+    return [HexBytes(rng.randrange(field).to_bytes(32, byteorder='big')) for _ in range(count)]
+
+
+'''
+@return Seconds to fill a new tree and its root
+'''
+def Measure(make: Callable[[], MerkleTree.Interface], fill: Callable[[MerkleTree.Interface], bool]) -> tuple[float, HexBytes | None]:
+    tree : MerkleTree.Interface = make()
+    begin: float                = time.perf_counter()
+    if not fill(tree):
+        Log.Print(f'Failed to fill {tree.implementation()}')
+        sys.exit(1)
+    return time.perf_counter() - begin, tree.root()
+
+
+def Main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description='Benchmark MerkleTree add() against add_many()')
+    parser.add_argument('--count', type=int, default=1000, help='Number of leafs')
+    parser.add_argument('--height', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args: argparse.Namespace = parser.parse_args()
+
+    Log.Init(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Tmp', 'Bench'), 'BenchMerkleTree')
+    leaves: list[HexBytes] = Leaves(args.count, args.seed)
+    Log.Print(f'{args.count} leafs, height {args.height}')
+    with tempfile.TemporaryDirectory() as folder:
+        for impl in (MerkleTree.ImplType.FRONTIER, MerkleTree.ImplType.MEMORY, MerkleTree.ImplType.COMPACT, MerkleTree.ImplType.MMAP):
+            files: list[str]                             = [os.path.join(folder, f'{impl.name}_{x}.tree') for x in ('add', 'many')]
+            make : Callable[[str], MerkleTree.Interface] = lambda path: MerkleTree.Create(impl, args.height, path, -1)
+            one  : tuple[float, HexBytes | None]         = Measure(lambda: make(files[0]), lambda x: all(x.add(leaf) for leaf in leaves))
+            many : tuple[float, HexBytes | None]         = Measure(lambda: make(files[1]), lambda x: x.add_many(leaves))
+            if one[1] != many[1]:
+                Log.Print(f'{impl.name}: add_many() root does not match add()')
+                sys.exit(1)
+            Log.Print(f'  {impl.name:8} add(): {one[0]:8.3f}s  add_many(): {many[0]:8.3f}s  {one[0] / many[0]:6.1f}x')
+
+
+if __name__ == '__main__':
+    Main()
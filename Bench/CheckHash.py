@@ -0,0 +1,94 @@
+'''
+Check cpphash against circomlib vectors, exits with 1 on any mismatch.
+    python Bench/CheckHash.py
+'''
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hexbytes import HexBytes
+
+import Log
+from cpphash import BabyJubjub, PedersenTable, cpphash
+
+
+# Outputs of circomlib poseidon() for [1], [1, 2] and [1, 2, 3, 4]
+POSEIDON_VECTORS: list[tuple[list[int], int]] = [
+    ([1],          18586133768512220936620570745912940619677854269274689475585506675881198879027),
+    ([1, 2],       7853200120776062878684798364095072458815029376092732009249414926327459813530),
+    ([1, 2, 3, 4], 18821383157269793795438455681495246036402687001665670618754263018637548127333),
+]
+
+# First point of the BASE table of circomlib pedersenHash, getBasePoint(0)
+PEDERSEN_GENERATOR: tuple[int, int] = (
+    10457101036533406547632367118273992217979173478358440826365724437999023779287,
+    19824078218392094440610104313265183977899662750282163392862422243483260492317,
+)
+
+
+'''
+Port of pedersenHash.js with one scalar multiplication per segment, independent of the fixed-base tables
+@return x of the resulting point
+'''
+def Pedersen(data: bytes) -> int:
+    bits  : list[int]       = [(data[i // 8] >> (i % 8)) & 1 for i in range(len(data) * 8)]
+    result: tuple[int, int] = (0, 1)
+    for segment in range(0, (len(bits) - 1) // 200 + 1):
+        scalar: int = 0
+        exp   : int = 1
+        for window in range(0, 50):
+            start: int = segment * 200 + window * 4
+            if start >= len(bits):
+                break
+            nibble: list[int] = (bits[start:start + 4] + [0] * 4)[:4]
+            value : int       = 1 + nibble[0] + 2 * nibble[1] + 4 * nibble[2]
+            scalar += -value * exp if nibble[3] else value * exp
+            exp <<= 5
+        point: tuple[int, int] = BabyJubjub.mul(PedersenTable.generator(segment), scalar % BabyJubjub.SUB_ORDER)
+        result = BabyJubjub.affine(BabyJubjub.add((*result, 1), (*point, 1)))
+    return result[0]
+
+
+def Main() -> None:
+    Log.Init(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Tmp', 'Bench'), 'CheckHash')
+    failed: int = 0
+
+    for inputs, expected in POSEIDON_VECTORS:
+        digest: int = int.from_bytes(cpphash.poseidon([HexBytes(x.to_bytes(32, byteorder='big')) for x in inputs])[1], byteorder='big')
+        if digest != expected:
+            Log.Print(f'FAIL poseidon({inputs}) = {digest}, expected {expected}')
+            failed += 1
+    pairs: list[tuple[HexBytes, HexBytes]] = [(HexBytes(x.to_bytes(32, byteorder='big')), HexBytes((x + 1).to_bytes(32, byteorder='big'))) for x in range(1, 9)]
+    if cpphash.poseidon_many(pairs) != [cpphash.poseidon([left, right])[1] for left, right in pairs]:
+        Log.Print('FAIL poseidon_many() differs from poseidon()')
+        failed += 1
+    for count in [0, 17]:
+        try:
+            cpphash.poseidon([HexBytes(bytes(32))] * count)
+            Log.Print(f'FAIL poseidon() of {count} inputs did not raise ValueError')
+            failed += 1
+        except ValueError:
+            pass
+        except Exception as e:
+            Log.Print(f'FAIL poseidon() of {count} inputs raised {type(e).__name__} instead of ValueError')
+            failed += 1
+
+    if PedersenTable.generator(0) != PEDERSEN_GENERATOR:
+        Log.Print(f'FAIL pedersen generator 0 = {PedersenTable.generator(0)}, expected {PEDERSEN_GENERATOR}')
+        failed += 1
+    rng: random.Random = random.Random(0)
+    for size in [1, 25, 31, 62, 100]:
+        data  : bytes = bytes(rng.randrange(256) for _ in range(size))
+        digest: int   = int.from_bytes(cpphash.pedersen([HexBytes(data)])[1], byteorder='big')
+        if digest != Pedersen(data):
+            Log.Print(f'FAIL pedersen({data.hex()}) = {digest}, expected {Pedersen(data)}')
+            failed += 1
+
+    Log.Print('All hash vectors match' if 0 == failed else f'{failed} hash vectors do not match')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,96 @@
+'''
+Check EventPoller backfill against local fake JSON-RPC servers, exits with 1 on any failure:
+concurrent requests deliver every event once and in block order, result-size errors split ranges, and the rate limit holds.
+    python Bench/CheckPoller.py
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Log
+import Var
+from Blockchain import EventPoller
+from FakeRpc import CONTRACT, Expected, FakeNode
+from Types import EventDeposit, EventWithdraw, LogEvent, Second
+
+
+'''
+Poll blocks 1 to head of node until caught up
+@return Events as (block number, leaf index or nullifier hash), blocks of block handler, ranges of batch handler
+'''
+def Poll(node: FakeNode, workers: int, rate: float) -> tuple[list[tuple[int, int | str]], list[int], list[tuple[int, int]]]:
+    events: list[tuple[int, int | str]] = []
+    blocks: list[int]                   = []
+    ranges: list[tuple[int, int]]       = []
+    def on_event(event: LogEvent) -> None:
+        events.append((event.blk_num, event.leaf_index if isinstance(event, EventDeposit) else event.nullifier_hash))
+
+    poller: EventPoller = EventPoller(node.start(), Second(1), workers=workers, rate=rate, hedge=0)
+    poller.add_event_handler(on_event)
+    poller.add_block_handler(blocks.append)
+    poller.add_batch_handler(lambda _, start, end: ranges.append((start, end)))
+    poller.start(CONTRACT, 1, [[EventDeposit.event_hash(), EventWithdraw.event_hash()]])
+    poller.catchup()
+    poller.stop()
+    node.stop()
+    return events, blocks, ranges
+
+
+'''
+@return Failures of the events, blocks and ranges delivered for blocks 1 to head
+'''
+def Delivered(name: str, head: int, events: list[tuple[int, int | str]], blocks: list[int], ranges: list[tuple[int, int]]) -> list[str]:
+    failures: list[str]                 = []
+    expected: list[tuple[int, int | str]] = Expected(1, head)
+    if events != expected:
+        missing: int = len(set(expected) - set(events))
+        failures.append(f'{name}: {len(events)}/{len(expected)} events, {missing} missing, {len(events) - len(set(events))} duplicated, '
+                        f'in block order: {[x[0] for x in events] == sorted(x[0] for x in events)}')
+    if len(blocks) == 0 or blocks != sorted(set(blocks)) or blocks[-1] != head:
+        failures.append(f'{name}: block handler not called in increasing order up to {head}, last: {blocks[-1:]}')
+    if len(ranges) == 0 or ranges[0][0] != 1 or ranges[-1][1] != head or any(x[1] + 1 != y[0] for x, y in zip(ranges, ranges[1:])):
+        failures.append(f'{name}: batch ranges not contiguous from 1 to {head}')
+    return failures
+
+
+def Main() -> None:
+    Log.Init(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Tmp', 'Bench'), 'CheckPoller')
+    # Fixed chunks of 100 blocks, so every case makes many requests
+    Var.RPC_CHUNK_SIZE = 100
+    Var.RPC_CHUNK_MAX  = 100
+    failures: list[str] = []
+
+    # Answers arrive out of order, events still go out in block order
+    node: FakeNode = FakeNode(20000, jitter=0.02)
+    failures += Delivered('parallel', node.head, *Poll(node, 8, 0))
+    answered: list[tuple[int, int]] = [x[2] for x in node.received('eth_getLogs')]
+    if answered == sorted(answered):
+        failures.append('parallel: answers came back in order, requests did not overlap')
+
+    # Ranges over the cap fail with -32005 and are split until they fit
+    node = FakeNode(5000, cap=37)
+    failures += Delivered('split', node.head, *Poll(node, 4, 0))
+    requests: list[tuple[float, str, tuple[int, int] | None, bool]] = node.received('eth_getLogs')
+    if all(x[3] for x in requests):
+        failures.append('split: no request hit the result-size limit')
+    if any(x[3] and x[2][1] - x[2][0] + 1 > node.cap for x in requests):
+        failures.append(f'split: a range over {node.cap} blocks was answered')
+
+    # Concurrent workers share one rate limit
+    rate: float = 20
+    node = FakeNode(4000)
+    failures += Delivered('rate', node.head, *Poll(node, 8, rate))
+    times   : list[float] = [x[0] for x in node.received('eth_getLogs')]
+    observed: float       = (len(times) - 1) / (max(times) - min(times))
+    if observed > rate * 1.1:
+        failures.append(f'rate: {observed:.1f} requests/s over the limit of {rate}')
+
+    for failure in failures:
+        Log.Print(f'FAIL {failure}')
+    Log.Print('All poller checks pass' if 0 == len(failures) else f'{len(failures)} poller checks failed')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    Main()
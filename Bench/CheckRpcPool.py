@@ -0,0 +1,81 @@
+'''
+Check RpcPool against local fake JSON-RPC servers with injected delays and outages, exits with 1 on any failure:
+a hedged request returns the answer of the fast endpoint, a failing endpoint cools down and is used again once it recovers.
+    python Bench/CheckRpcPool.py
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Log
+import Var
+from Blockchain import RpcEndpoint, RpcPool
+from FakeRpc import FakeNode
+from Types import Second
+from Utils import UnixTimestamp
+
+
+'''
+@return Head of the endpoint that answered and seconds taken
+'''
+def BlockNumber(pool: RpcPool) -> tuple[int, float]:
+    begin: float = time.perf_counter()
+    head : int   = pool.call(lambda x: x.w3.eth.block_number)
+    return head, time.perf_counter() - begin
+
+
+def Main() -> None:
+    Log.Init(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Tmp', 'Bench'), 'CheckRpcPool')
+    Var.RPC_RETRY_INTERVAL = Second(0.5)  # First cooldown
+    failures: list[str] = []
+
+    # Endpoints are told apart by their head, unknown ones are ranked in given order so the slow one goes first
+    slow : FakeNode = FakeNode(100, delay=1.0)
+    fast : FakeNode = FakeNode(200, delay=0.02)
+    pool : RpcPool  = RpcPool([slow.start(), fast.start()], hedge=Second(0.1))
+    head, elapsed = BlockNumber(pool)
+    time.sleep(slow.delay)  # Requests are recorded when answered, the slow duplicate still updates the score
+    if 0 == len(slow.received()) or pool.endpoints[0].latency is None:
+        failures.append('hedge: slow endpoint was not asked first')
+    if head != fast.head or elapsed > slow.delay / 2:
+        failures.append(f'hedge: got head {head} after {elapsed:.2f}s, expect {fast.head} of the fast endpoint in well under {slow.delay}s')
+    pool.close()
+    slow.stop()
+    fast.stop()
+
+    # An endpoint answering 503 fails over, cools down, then is preferred again after it recovers
+    flaky : FakeNode = FakeNode(300, down=True)
+    backup: FakeNode = FakeNode(400, delay=0.05)
+    pool = RpcPool([flaky.start(), backup.start()], hedge=Second(0))
+    endpoint: RpcEndpoint = pool.endpoints[0]
+    head, _ = BlockNumber(pool)
+    if head != backup.head:
+        failures.append(f'cooldown: got head {head}, expect {backup.head} of the backup endpoint')
+    if not (endpoint.failures > 0 and endpoint.cooldown > UnixTimestamp() and pool.rank()[-1] is endpoint):
+        failures.append(f'cooldown: failing endpoint not cooling down, failures: {endpoint.failures}, ranked last: {pool.rank()[-1] is endpoint}')
+    asked: int = len(flaky.received())
+    if asked != 1:
+        failures.append(f'cooldown: failing endpoint was asked {asked} times before failing over, expect 1')
+    head, _ = BlockNumber(pool)
+    if head != backup.head or len(flaky.received()) != asked:
+        failures.append('cooldown: endpoint was asked again while cooling down')
+
+    flaky.down = False
+    time.sleep(max(0.0, endpoint.cooldown - UnixTimestamp()) + 0.1)
+    head, _ = BlockNumber(pool)
+    if head != flaky.head or endpoint.failures != 0:
+        failures.append(f'recover: got head {head}, expect {flaky.head} of the recovered endpoint, failures: {endpoint.failures}')
+    pool.close()
+    flaky.stop()
+    backup.stop()
+
+    for failure in failures:
+        Log.Print(f'FAIL {failure}')
+    Log.Print('All pool checks pass' if 0 == len(failures) else f'{len(failures)} pool checks failed')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    Main()
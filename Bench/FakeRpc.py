@@ -0,0 +1,139 @@
+'''
+JSON-RPC server of a made-up chain on localhost for the Check scripts, with injected delays, errors and result-size limits.
+The contract has a deposit every 7th block and a withdraw every 13th block.
+'''
+import json
+import random
+import threading as TR
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+from web3 import Web3
+
+from Types import EventDeposit, EventWithdraw
+
+
+CONTRACT: str = Web3.to_checksum_address('0x910cbd523d52c6e0d3ef5b87d1a4c8fb5b2f0a4b')
+
+
+'''
+Logs of the contract in a block range, both ends inclusive, as get_logs returns them
+'''
+def Logs(start: int, end: int) -> list[dict]:
+    word: Callable[[int], str] = lambda x: '0x' + x.to_bytes(32, byteorder='big').hex()
+    logs: list[dict]           = []
+    for block in range(start, end + 1):
+        if 0 == block % 7:
+            logs.append({'topics': [EventDeposit.TOPIC.to_0x_hex(), word(block * 1000 + 1)],
+                         'data'  : '0x' + (1700000000 + block).to_bytes(32, byteorder='big').hex() + (block // 7 - 1).to_bytes(32, byteorder='big').hex(),
+                         'block' : block, 'index': 0})
+        if 0 == block % 13:
+            logs.append({'topics': [EventWithdraw.TOPIC.to_0x_hex()],
+                         'data'  : '0x' + bytes(12).hex() + bytes.fromhex('ab' * 20).hex() + word(block * 99)[2:] + word(10 ** 15)[2:],
+                         'block' : block, 'index': 1})
+    return [{
+        'address'         : CONTRACT,
+        'topics'          : x['topics'],
+        'data'            : x['data'],
+        'blockNumber'     : hex(x['block']),
+        'blockHash'       : word(x['block'] + 7),
+        'transactionHash' : word(x['block'] * 2 + x['index']),
+        'transactionIndex': hex(x['index']),
+        'logIndex'        : hex(x['index']),
+        'removed'         : False,
+    } for x in logs]
+
+
+'''
+Events the poller must deliver for a block range, as (block number, leaf index or nullifier hash)
+'''
+def Expected(start: int, end: int) -> list[tuple[int, int | str]]:
+    events: list[tuple[int, int | str]] = []
+    for block in range(start, end + 1):
+        if 0 == block % 7:
+            events.append((block, block // 7 - 1))
+        if 0 == block % 13:
+            events.append((block, '0x' + (block * 99).to_bytes(32, byteorder='big').hex()))
+    return events
+
+
+class FakeNode(object):
+
+    '''
+    @param head     Latest block number
+    @param delay    Seconds before answering a request
+    @param jitter   Random extra seconds up to this, so concurrent answers arrive out of order
+    @param cap      Max blocks of a get_logs range, larger ranges get a -32005 result-size error, None if unlimited
+    @param down     Answer every request with HTTP 503
+    '''
+    def __init__(self, head: int, delay: float = 0.0, jitter: float = 0.0, cap: int | None = None, down: bool = False) -> None:
+        self.mutex   : TR.Lock                                                = TR.Lock()
+        self.head    : int                                                    = head
+        self.delay   : float                                                  = delay
+        self.jitter  : float                                                  = jitter
+        self.cap     : int | None                                             = cap
+        self.down    : bool                                                   = down
+        self.requests: list[tuple[float, str, tuple[int, int] | None, bool]] = []  # Time, method, get_logs range, answered
+        self.server  : ThreadingHTTPServer | None                             = None
+
+    '''
+    @return URL of the server
+    '''
+    def start(self) -> str:
+        node: FakeNode = self
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                request: dict = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                status, body  = node._answer(request)
+                data  : bytes = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        TR.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    '''
+    Requests received so far
+    @param method   Only of this JSON-RPC method, all if None
+    '''
+    def received(self, method: str | None = None) -> list[tuple[float, str, tuple[int, int] | None, bool]]:
+        with self.mutex:
+            return [x for x in self.requests if method is None or x[1] == method]
+
+    def _answer(self, request: dict) -> tuple[int, dict]:
+        method : str                    = request['method']
+        span   : tuple[int, int] | None = None
+        status : int                    = 200
+        body   : dict                   = {'jsonrpc': '2.0', 'id': request['id']}
+        time.sleep(self.delay + random.random() * self.jitter)
+        if self.down:
+            status = 503
+            body['error'] = {'code': -32603, 'message': 'service unavailable'}
+        elif 'eth_blockNumber' == method:
+            body['result'] = hex(self.head)
+        elif 'eth_chainId' == method:
+            body['result'] = '0x1'
+        elif 'eth_getLogs' == method:
+            span = (int(request['params'][0]['fromBlock'], 16), int(request['params'][0]['toBlock'], 16))
+            if self.cap is not None and span[1] - span[0] + 1 > self.cap:
+                body['error'] = {'code': -32005, 'message': 'query returned more than 10000 results'}
+            else:
+                body['result'] = Logs(span[0], span[1])
+        else:
+            body['error'] = {'code': -32601, 'message': f'method not found: {method}'}
+        with self.mutex:
+            self.requests.append((time.time(), method, span, 'result' in body))
+        return status, body
@@ -1,57 +1,297 @@
+import json
 import threading as TR
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import partial
 from eth_typing import ChecksumAddress
 from hexbytes import HexBytes
-from typing import Callable
+from typing import Any, Callable, Iterator
 from web3 import Web3
-from web3.types import LogReceipt, Wei
+from web3.types import LogReceipt
+from websockets.sync.client import ClientConnection, connect
 
 import Log
 import Var
 from Executor import Job, TaskQueue
-from Types import EventDeposit, EventWithdraw, LogEvent, Second
-from Utils import Sleep, UnixTimestamp
+from Types import DecodeLogs, EventDeposit, EventWithdraw, LogEvent, Second
+from Utils import RateLimiter, Sleep, UnixTimestamp
+
+
+# Called with events, from block and to block of a range
+BatchHandler = Callable[[list[LogEvent], int, int], None]
+
+
+class ChunkSizer(object):
+
+    # Best size and failed size of each RPC endpoint, shared by pollers of the same endpoint
+    BEST: dict[str, tuple[int, int | None]] = {}
+
+    # Lower-cased fragments of errors providers return when a range has too many results or blocks,
+    # rate limits (HTTP 429) and timeouts are failures of the endpoint instead
+    LIMIT_ERRORS: tuple[str, ...] = ('-32005', 'query returned more than', 'block range too large', 'block range is too large',
+                                     'exceed maximum block range', 'response size exceeded')
+
+    # Successes after which the last failed size is forgotten
+    RESET: int = 64
+
+    '''
+    Adapt number of blocks per get_logs request to the endpoint and density of logs.
+    Grow after small and fast responses, halve after size-limit errors or slow responses,
+    and stay under the last failed size until it is forgotten.
+    @param endpoint RPC URL the size is remembered for
+    '''
+    def __init__(self, endpoint: str) -> None:
+        self.mutex    : TR.Lock    = TR.Lock()
+        self.endpoint : str        = endpoint
+        self.size     : int        = Var.RPC_CHUNK_SIZE
+        self.failed   : int | None = None  # Size of last size-limit error
+        self.succeeded: int        = 0     # Successes since last size-limit error
+        self.size, self.failed = ChunkSizer.BEST.get(endpoint, (self.size, self.failed))
+
+    @staticmethod
+    def is_limit(error: Exception) -> bool:
+        message: str = str(error).lower()
+        return any(x in message for x in ChunkSizer.LIMIT_ERRORS)
+
+    def get(self) -> int:
+        with self.mutex:
+            return self.size
+
+    '''
+    Adjust after a successful response
+    @param blocks   Number of blocks requested
+    @param logs     Number of logs returned
+    @param elapsed  Response time
+    '''
+    def succeed(self, blocks: int, logs: int, elapsed: Second) -> None:
+        with self.mutex:
+            # Only responses of a full-size chunk tell about the size, the last chunk at head is usually shorter
+            if blocks < self.size:
+                return
+            self.succeeded += 1
+            if self.failed is not None and self.succeeded >= ChunkSizer.RESET:
+                self.failed = None
+            if logs > Var.RPC_CHUNK_LOGS or elapsed > Var.RPC_CHUNK_LATENCY:
+                self.size = max(1, self.size // 2)
+            elif logs < Var.RPC_CHUNK_LOGS // 4 and elapsed < Var.RPC_CHUNK_LATENCY / 2:
+                size: int = min(self.size * 2, Var.RPC_CHUNK_MAX)
+                if self.failed is not None:
+                    size = min(size, max(self.size, (self.size + self.failed) // 2))
+                self.size = size
+            ChunkSizer.BEST[self.endpoint] = (self.size, self.failed)
+
+    '''
+    Halve after a size-limit error of a request of blocks
+    '''
+    def fail(self, blocks: int) -> None:
+        with self.mutex:
+            self.failed    = blocks if self.failed is None else min(self.failed, blocks)
+            self.succeeded = 0
+            self.size      = max(1, min(self.size, blocks // 2))
+            ChunkSizer.BEST[self.endpoint] = (self.size, self.failed)
+
+
+class RpcEndpoint(object):
+
+    '''
+    Live score of one RPC endpoint, lower is better
+    @param url  HTTP or WebSocket RPC URL
+    '''
+    def __init__(self, url: str) -> None:
+        self.url     : str            = url
+        # Retries are left to RpcPool, which fails over to another endpoint instead of backing off on this one
+        self.w3      : Web3           = Web3(Web3.HTTPProvider(url, exception_retry_configuration=None)) if url.startswith('http') else Web3(Web3.LegacyWebSocketProvider(url))
+        self.latency : Second | None  = None       # Moving average of response time, None until first response
+        self.errors  : float          = 0.0        # Moving average of failure, 0 to 1
+        self.failures: int            = 0          # Consecutive failures
+        self.cooldown: Second         = Second(0)  # Not preferred until this time point
+        self.sizer   : ChunkSizer     = ChunkSizer(url)
+        self.serial  : TR.Lock | None = None if url.startswith('http') else TR.Lock()  # One request in flight on a WebSocket connection
+
+    def score(self, now: Second) -> float:
+        # Unknown endpoints are tried first, cooling down ones last
+        latency: float = 0.0 if self.latency is None else self.latency
+        return latency * (1 + 4 * self.errors) + (3600 if now < self.cooldown else 0)
+
+    def record(self, elapsed: Second, succeed: bool) -> None:
+        self.errors = self.errors * 0.7 + (0.0 if succeed else 0.3)
+        if succeed:
+            self.latency  = elapsed if self.latency is None else Second(self.latency * 0.7 + elapsed * 0.3)
+            self.failures = 0
+        else:
+            self.failures += 1
+            self.cooldown  = Second(UnixTimestamp() + min(Var.RPC_RETRY_INTERVAL * 2 ** (self.failures - 1), 60))
+
+
+class RpcPool(object):
+
+    '''
+    Route each call to the endpoint of best latency and error score, fail over to the next one on error.
+    With hedging, a duplicate request goes to the next endpoint if no answer after hedge seconds,
+    the first answer is taken.
+    @param urls     HTTP or WebSocket RPC URLs
+    @param hedge    Delay before hedging a request, 0 to disable
+    '''
+    def __init__(self, urls: list[str], hedge: Second = Var.RPC_HEDGE_DELAY) -> None:
+        self.TAG      : str                = __class__.__name__
+        self.mutex    : TR.Lock            = TR.Lock()
+        self.endpoints: list[RpcEndpoint]  = [RpcEndpoint(url) for url in urls]
+        self.hedge    : Second             = hedge
+        self.executor : ThreadPoolExecutor = ThreadPoolExecutor(max_workers=len(urls) * 8, thread_name_prefix=self.TAG)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def rank(self) -> list[RpcEndpoint]:
+        now: Second = UnixTimestamp()
+        with self.mutex:
+            return sorted(self.endpoints, key=lambda x: x.score(now))
+
+    '''
+    Blocks per get_logs request, of the endpoint calls go to first
+    '''
+    def chunk_size(self) -> int:
+        return self.rank()[0].sizer.get()
+
+    '''
+    Call fn with endpoints
+    @param  fn          Request to send, with Web3 of the endpoint
+    @param  penalize    Whether an error is the endpoint's fault, other errors are raised to the caller right away
+    @return Result of the first endpoint that answered
+    @raise  Exception of the last endpoint if all endpoints failed
+    '''
+    def call(self, fn: Callable[[RpcEndpoint], Any], penalize: Callable[[Exception], bool] = lambda e: True) -> Any:
+        ranked: list[RpcEndpoint] = self.rank()
+        if self.hedge > 0 and len(ranked) > 1:
+            return self._hedged(ranked, fn, penalize)
+        error: Exception | None = None
+        for endpoint in ranked:
+            try:
+                return self._run(endpoint, fn, penalize)
+            except Exception as e:
+                if not penalize(e):
+                    raise
+                Log.Warn(self.TAG, f'Endpoint {endpoint.url} failed, error: {e}')
+                error = e
+        raise error
+
+    def _hedged(self, ranked: list[RpcEndpoint], fn: Callable[[RpcEndpoint], Any], penalize: Callable[[Exception], bool]) -> Any:
+        pending: set[Future]      = {self.executor.submit(self._run, ranked[0], fn, penalize)}
+        index  : int              = 1
+        timeout: float | None     = self.hedge
+        error  : Exception | None = None
+        while len(pending) > 0:
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # Slower duplicates keep running, they still update the score
+                    return future.result()
+                error = future.exception()
+                if not penalize(error):
+                    raise error
+            # Hedge on timeout, fail over on error
+            if index < len(ranked):
+                pending.add(self.executor.submit(self._run, ranked[index], fn, penalize))
+                index += 1
+            # Nothing more to hedge with, wait for an answer
+            if index >= len(ranked):
+                timeout = None
+        raise error
+
+    def _run(self, endpoint: RpcEndpoint, fn: Callable[[RpcEndpoint], Any], penalize: Callable[[Exception], bool]) -> Any:
+        if endpoint.serial is None:
+            return self._request(endpoint, fn, penalize)
+        with endpoint.serial:
+            return self._request(endpoint, fn, penalize)
+
+    def _request(self, endpoint: RpcEndpoint, fn: Callable[[RpcEndpoint], Any], penalize: Callable[[Exception], bool]) -> Any:
+        begin: Second = UnixTimestamp()
+        try:
+            result: Any = fn(endpoint)
+        except Exception as e:
+            if penalize(e):
+                with self.mutex:
+                    endpoint.record(Second(UnixTimestamp() - begin), False)
+            raise
+        with self.mutex:
+            endpoint.record(Second(UnixTimestamp() - begin), True)
+        return result
 
 
 class EventPoller(object):
 
-    def __init__(self, rpc_url: str, interval: Second):
-        self.TAG     : str                             = __class__.__name__
-        self.rpc_url : str                             = rpc_url
-        self.w3      : Web3 | None                     = None
-        self.interval: Second                          = interval
-        self.contract: ChecksumAddress | None          = None
-        self.events  : list[HexBytes] | None           = None
-        self.block   : int                             = 0
-        self.on_event: set[Callable[[LogEvent], None]] = set()
-        self.on_block: set[Callable[[int], None]]      = set()
-        self.off     : bool                            = True
-        self.synced  : bool                            = False
-        self.time    : Second                          = Second(0)
-        self.cond    : TR.Condition                    = TR.Condition()
-        self.worker  : TR.Thread | None                = None
-        self.sinker  : TaskQueue                       = TaskQueue()
-
-    '''
-    Start polling
-    @param contract     Contract address, 0.1/1/10/100 ETH
-    @param start_block  Start block number, inclusive
+    # Blocks before the cursor whose delivered logs are still remembered with a subscription,
+    # so a late pushed log among them is refetched without duplicates
+    SEEN_BLOCKS: int = 64
+
+    '''
+    @param rpc_url      HTTP or WebSocket RPC URL, or a list of them to route requests by latency and errors
+    @param interval     Polling interval at head
+    @param workers      Concurrent requests while backfilling history, 1 to poll sequentially, one at a time per WebSocket endpoint
+    @param rate         Max requests per second while backfilling history
+    @param hedge        Send a duplicate request to another endpoint if no answer after hedge seconds, 0 to disable
+    @param subscribe    Once caught up, subscribe to logs and new heads on the first WebSocket URL instead of polling, off by default
+    '''
+    def __init__(self, rpc_url  : str | list[str],
+                       interval : Second,
+                       workers  : int    = Var.RPC_BACKFILL_WORKERS,
+                       rate     : float  = Var.RPC_BACKFILL_RATE,
+                       hedge    : Second = Var.RPC_HEDGE_DELAY,
+                       subscribe: bool   = False):
+        self.TAG              : str                                                    = __class__.__name__
+        self.rpc_url          : list[str]                                              = [rpc_url] if isinstance(rpc_url, str) else list(rpc_url)
+        self.hedge            : Second                                                 = hedge
+        self.pool             : RpcPool | None                                         = None
+        self.interval         : Second                                                 = interval
+        self.contracts        : dict[ChecksumAddress, int]                             = {}  # Contract -> cursor, next block to process
+        self.events           : list[HexBytes] | None                                  = None
+        self.block            : int                                                    = 0   # Smallest cursor of contracts
+        self.on_event         : set[Callable[[LogEvent], None]]                        = set()
+        self.on_block         : set[Callable[[int], None]]                             = set()
+        self.on_contract_event: dict[ChecksumAddress, set[Callable[[LogEvent], None]]] = {}
+        self.on_contract_block: dict[ChecksumAddress, set[Callable[[int], None]]]      = {}
+        self.on_batch         : set[BatchHandler]                                      = set()
+        self.on_contract_batch: dict[ChecksumAddress, set[BatchHandler]]               = {}
+        self.off              : bool                                                   = True
+        self.synced           : bool                                                   = False
+        self.time             : Second                                                 = Second(0)
+        self.cond             : TR.Condition                                           = TR.Condition()
+        self.worker           : TR.Thread | None                                       = None
+        self.sinker           : TaskQueue                                              = TaskQueue()
+        self.workers          : int                                                    = max(1, workers)
+        self.limiter          : RateLimiter                                            = RateLimiter(rate)
+        self.ws_url           : str | None                                             = next((x for x in self.rpc_url if x.startswith('ws')), None) if subscribe else None
+        self.seen             : dict[tuple[str, int], int]                             = {}  # (tx hash, log index) -> block number, of delivered logs
+
+    '''
+    Start polling, logs of all contracts are fetched by one get_logs request per range
+    @param contract     Contract address, 0.1/1/10/100 ETH, or a list of them
+    @param start_block  Start block number, inclusive, or of each contract to resume each from its own database
     @param events       List of event hashes to poll
     '''
-    def start(self, contract: ChecksumAddress, start_block: int, events: list[HexBytes]) -> bool:
+    def start(self, contract   : ChecksumAddress | list[ChecksumAddress],
+                    start_block: int | dict[ChecksumAddress, int],
+                    events     : list[HexBytes]) -> bool:
         if not self.off:
             Log.Warn(self.TAG, 'start() already started')
             return False
-        if self.rpc_url.startswith('http'):
-            self.w3 = Web3(Web3.HTTPProvider(self.rpc_url))
-        elif self.rpc_url.startswith('ws'):
-            self.w3 = Web3(Web3.LegacyWebSocketProvider(self.rpc_url))
-        else:
-            Log.Error(self.TAG, f'Unsupported RPC URL: {self.rpc_url}')
+        for url in self.rpc_url:
+            if not url.startswith('http') and not url.startswith('ws'):
+                Log.Error(self.TAG, f'Unsupported RPC URL: {url}')
+                return False
+        if 0 == len(self.rpc_url):
+            Log.Error(self.TAG, f'No RPC URL')
+            return False
+        contracts: list[ChecksumAddress] = [contract] if isinstance(contract, str) else list(contract)
+        if 0 == len(contracts):
+            Log.Error(self.TAG, f'No contract')
             return False
+        self.pool      = RpcPool(self.rpc_url, self.hedge)
         self.off       = False
         self.events    = events
-        self.contract  = contract
-        self.block     = start_block
+        self.contracts = {Web3.to_checksum_address(x): start_block if isinstance(start_block, int) else start_block[x] for x in contracts}
+        self.block     = min(self.contracts.values())
+        self.sinker.start()
         self.worker    = TR.Thread(target=self._loop)
         self.worker.start()
         Log.Debug(self.TAG, "start() done")
@@ -67,18 +307,46 @@ class EventPoller(object):
             self.cond.notify_all()
         self.worker.join()
         self.worker   = None
-        self.events   = None
-        self.contract = None
-        self.w3       = None
+        self.sinker.stop()
+        self.events    = None
+        self.contracts = {}
+        self.pool.close()
+        self.pool      = None
         Log.Debug(self.TAG, 'stop() done')
 
-    def add_event_handler(self, callback: Callable[[LogEvent], None]) -> None:
+    '''
+    @param contract Only events of this contract, e.g. to its own Database and MerkleTree, all contracts if None
+    '''
+    def add_event_handler(self, callback: Callable[[LogEvent], None], contract: ChecksumAddress | None = None) -> None:
         with self.cond:
-            self.on_event.add(callback)
+            if contract is None:
+                self.on_event.add(callback)
+            else:
+                self.on_contract_event.setdefault(Web3.to_checksum_address(contract), set()).add(callback)
 
-    def add_block_handler(self, callback: Callable[[int], None]) -> None:
+    '''
+    @param contract Only progress of this contract, called once the contract's cursor passes its start block, all contracts if None
+    '''
+    def add_block_handler(self, callback: Callable[[int], None], contract: ChecksumAddress | None = None) -> None:
         with self.cond:
-            self.on_block.add(callback)
+            if contract is None:
+                self.on_block.add(callback)
+            else:
+                self.on_contract_block.setdefault(Web3.to_checksum_address(contract), set()).add(callback)
+
+    '''
+    Get events of a range at once, in block order, e.g. to ingest a whole chunk into Database and MerkleTree in one call.
+    Also called for ranges without events, so a sink can commit to_block as its resume point.
+    The list is shared by handlers and must not be modified.
+    @param callback     Called with events, from block and to block, both inclusive
+    @param contract     Only events of this contract, all contracts if None
+    '''
+    def add_batch_handler(self, callback: BatchHandler, contract: ChecksumAddress | None = None) -> None:
+        with self.cond:
+            if contract is None:
+                self.on_batch.add(callback)
+            else:
+                self.on_contract_batch.setdefault(Web3.to_checksum_address(contract), set()).add(callback)
 
     '''
     Wait until catch up to latest block
@@ -100,7 +368,7 @@ class EventPoller(object):
             # Get latest block number
             while latest <= 0:
                 try:
-                    latest = self.w3.eth.block_number
+                    latest = self.pool.call(lambda x: x.w3.eth.block_number)
                 except Exception as e:
                     Log.Error(self.TAG, f'Failed to get latest block number, error: {e}')
                     Log.Info(self.TAG, f'Wait {Var.RPC_RETRY_INTERVAL}s and retry')
@@ -110,77 +378,341 @@ class EventPoller(object):
             # Sleep interval if no new block
             if latest < self.block:
                 self.synced = True
-                Sleep(self.interval, self.cond)
+                self._idle(self.interval)
                 continue
             self.synced = False
-            count_block = latest - self.block + 1
 
-            # Split into 1000 blocks per request
-            chunks: list[tuple[int, int]] = []
-            if latest == self.block:
-                chunks.append((self.block, latest))
+            # Backfill in parallel when far behind, poll sequentially at head
+            chunks : Iterator[tuple[int, int]]                            = self._chunks(self.block, latest)
+            results: Iterator[tuple[tuple[int, int], list[LogReceipt]]]
+            if latest - self.block + 1 > self.pool.chunk_size() and self.workers > 1:
+                results = self._backfill(chunks)
             else:
-                for i in range(self.block, latest, 1000):
-                    chunks.append((i, min(i + 1000, latest)))
-
-            # Process each chunk
-            for chunk in chunks:
-                # Get logs
-                logs: list[LogReceipt] | None = None
-                while logs is None:
-                    try:
-                        logs = self.w3.eth.get_logs({
-                            'address'  : self.contract,
-                            'fromBlock': chunk[0],
-                            'toBlock'  : chunk[1],
-                            'topics'   : self.events,
-                        })
-                    except Exception as e:
-                        Log.Error(self.TAG, f'Failed to get logs, error: {e}')
-                        Log.Info(self.TAG, f'Wait {Var.RPC_RETRY_INTERVAL}s and retry')
-                        Sleep(Var.RPC_RETRY_INTERVAL, self.cond)
-
-                # Process logs
-                for log in logs:
-                    if EventDeposit.event_hash() == log['topics'][0]:
-                        timestamp : int = int.from_bytes(log['data'][:32], byteorder='big')
-                        blk_num   : int = log['blockNumber']
-                        tx_hash   : str = log['transactionHash'].to_0x_hex()
-                        commitment: str = log['topics'][1].to_0x_hex()
-                        leaf_index: int = int.from_bytes(log['data'][32:], byteorder='big')
-                        for call in self.on_event:
-                            self.sinker.run_async(Job('EventDeposit', lambda: call(EventDeposit(timestamp, blk_num, tx_hash, commitment, leaf_index))))
+                results = self._sequential(chunks)
+
+            # Process logs in block order
+            done: int | None = None
+            for chunk, logs in results:
+                events: list[tuple[ChecksumAddress, LogEvent]] = self._decode(logs)
+                for _, event in events:
+                    if isinstance(event, EventDeposit):
                         count_event_deposit += 1
-                    elif EventWithdraw.event_hash() == log['topics'][0]:
-                        blk_num       : int = log['blockNumber']
-                        tx_hash       : str = log['transactionHash'].to_0x_hex()
-                        nullifier_hash: str = log['data'][32:64].to_0x_hex()
-                        to            : str = log['data'][12:32].to_0x_hex()
-                        fee           : Wei = Wei(int.from_bytes(log['data'][64:], byteorder='big'))
-                        for call in self.on_event:
-                            self.sinker.run_async(Job('EventWithdraw', lambda: call(EventWithdraw(blk_num, tx_hash, nullifier_hash, to, fee))))
+                    elif isinstance(event, EventWithdraw):
                         count_event_withdraw += 1
-                    else:
-                        Log.Warn(self.TAG, f'Unknown event: {log}')
+                if self.ws_url is not None:
+                    for log in logs:
+                        if log['blockNumber'] > latest - EventPoller.SEEN_BLOCKS:
+                            self._remember(log)
+                self._deliver(events, chunk[0], chunk[1])
+                done = chunk[1]
 
-                # Prevent reach the rate limit
-                Sleep(Var.RPC_QUERY_INTERVAL, self.cond)
+            # Stopped before any chunk is done
+            if done is None:
+                continue
+            count_block = done - self.block + 1
+            latest      = done
 
             # Log and notify
             Log.Info(self.TAG, f'Poll {count_block} blocks, {count_event_deposit} deposits, {count_event_withdraw} withdraws')
 
             # Callback and update
-            for call in self.on_block:
-                self.sinker.run_async(Job('Progress', lambda: call(latest)))
-            self.block = latest + 1
+            self._progress(latest)
 
             # Sleep interval
             self.time: Second = Second(self.time + self.interval)
             gap: Second = Second(self.time - UnixTimestamp())
             if gap > 0:
                 self.synced = True
-                Sleep(gap, self.cond)
+                self._idle(gap)
                 self.synced = False
 
         # Reset timestamp
         self.time = Second(0)
+
+    '''
+    Notify block handlers that all blocks up to latest are processed, and move on
+    '''
+    def _progress(self, latest: int) -> None:
+        for call in self.on_block:
+            self.sinker.run_async(Job('Progress', partial(call, latest)))
+        for contract, cursor in self.contracts.items():
+            if latest < cursor:
+                continue
+            for call in self.on_contract_block.get(contract, ()):
+                self.sinker.run_async(Job('Progress', partial(call, latest)))
+            self.contracts[contract] = latest + 1
+        self.block = min(self.contracts.values())
+        # Logs before the cursor are not delivered again by get_logs, unless a late log rewinds the cursor
+        self.seen = {key: block for key, block in self.seen.items() if block >= self.block - EventPoller.SEEN_BLOCKS}
+
+    '''
+    Parse logs of a response in one pass, logs already delivered by subscription or near the cursor are skipped
+    @return Contract and event of each log to deliver, in order of logs
+    '''
+    def _decode(self, logs: list[LogReceipt]) -> list[tuple[ChecksumAddress, LogEvent]]:
+        # Range starts from the smallest cursor, skip blocks a contract has passed already
+        wanted: list[LogReceipt]                       = [log for log in logs if not self._seen(log) and log['blockNumber'] >= self.contracts.get(log['address'], 0)]
+        events: list[tuple[ChecksumAddress, LogEvent]] = []
+        for log, event in zip(wanted, DecodeLogs(wanted)):
+            if event is None:
+                Log.Warn(self.TAG, f'Unknown event: {log}')
+                continue
+            events.append((log['address'], event))
+        return events
+
+    def _seen(self, log: LogReceipt) -> bool:
+        return len(self.seen) > 0 and (log['transactionHash'].to_0x_hex(), log['logIndex']) in self.seen
+
+    def _remember(self, log: LogReceipt) -> None:
+        self.seen[(log['transactionHash'].to_0x_hex(), log['logIndex'])] = log['blockNumber']
+
+    '''
+    Queue events of a range to handlers as one job, a range without events is only queued for batch handlers
+    @param events   Contract and event of each log, in block order
+    '''
+    def _deliver(self, events: list[tuple[ChecksumAddress, LogEvent]], start: int, end: int) -> None:
+        if 0 == len(events) and 0 == len(self.on_batch) and 0 == len(self.on_contract_batch):
+            return
+        # Range of each contract, blocks before its cursor are not its range
+        ranges: dict[ChecksumAddress, int] = {contract: max(start, cursor) for contract, cursor in self.contracts.items() if cursor <= end}
+        self.sinker.run_async(Job('Events', partial(self._sink, events, start, end, ranges)))
+
+    '''
+    Call event handlers for each event, then batch handlers once, on the sinker
+    @param ranges   Contract -> from block, of contracts the range covers
+    '''
+    def _sink(self, events: list[tuple[ChecksumAddress, LogEvent]], start: int, end: int, ranges: dict[ChecksumAddress, int]) -> None:
+        with self.cond:
+            on_event         : set[Callable[[LogEvent], None]]                        = set(self.on_event)
+            on_contract_event: dict[ChecksumAddress, set[Callable[[LogEvent], None]]] = {k: set(v) for k, v in self.on_contract_event.items()}
+            on_batch         : set[BatchHandler]                                      = set(self.on_batch)
+            on_contract_batch: dict[ChecksumAddress, set[BatchHandler]]               = {k: set(v) for k, v in self.on_contract_batch.items()}
+        for contract, event in events:
+            for call in on_event | on_contract_event.get(contract, set()):
+                self._call(call, event)
+        if len(on_batch) > 0:
+            batch: list[LogEvent] = [event for _, event in events]
+            for call in on_batch:
+                self._call(call, batch, start, end)
+        for contract, calls in on_contract_batch.items():
+            if contract not in ranges:
+                continue
+            own: list[LogEvent] = [event for address, event in events if address == contract]
+            for call in calls:
+                self._call(call, own, ranges[contract], end)
+
+    '''
+    Call a handler, an exception does not stop other handlers
+    '''
+    def _call(self, call: Callable[..., None], *args: Any) -> None:
+        try:
+            call(*args)
+        except Exception as e:
+            Log.Error(self.TAG, f'Exception in handler {getattr(call, "__qualname__", call)}: {e}')
+
+    '''
+    Wait for new blocks at head, by subscription if a WebSocket URL is given, otherwise sleep
+    '''
+    def _idle(self, interval: Second) -> None:
+        if self.ws_url is None or not self._subscribe(self.ws_url):
+            Sleep(interval, self.cond)
+            return
+        self.time = UnixTimestamp()
+
+    '''
+    Deliver logs as they are pushed, until disconnected, stale or stopped.
+    Subscribe first, then fill the gap since the last poll with get_logs, so no block is missed in between.
+    A block is reported to block handlers when the next head arrives, when its logs have all been pushed.
+    Removed logs of reorganized blocks are not delivered.
+    @return False if failed to subscribe or closed before any new head, so the caller waits before reconnecting
+    '''
+    def _subscribe(self, url: str) -> bool:
+        try:
+            ws: ClientConnection = connect(url, open_timeout=Var.RPC_SUBSCRIBE_TIMEOUT, close_timeout=1, max_size=None)
+        except Exception as e:
+            Log.Error(self.TAG, f'Failed to connect {url}, error: {e}')
+            return False
+
+        pending: list[tuple[int, ChecksumAddress, LogEvent]] = []    # Block number, contract and event of pushed logs, until the next head
+        late   : tuple[ChecksumAddress, int] | None          = None  # Contract and block of a log pushed after its block is done
+        heads  : int                                         = 0     # New heads handled
+        with ws:
+            try:
+                # Subscribe
+                topics: list = [[HexBytes(x).to_0x_hex() for x in topic] if isinstance(topic, list) else (None if topic is None else HexBytes(topic).to_0x_hex())
+                                for topic in self.events]
+                ws.send(json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': 'eth_subscribe', 'params': ['newHeads']}))
+                ws.send(json.dumps({'jsonrpc': '2.0', 'id': 2, 'method': 'eth_subscribe', 'params': ['logs', {'address': list(self.contracts), 'topics': topics}]}))
+                subscriptions: dict[str, str] = {}  # Subscription id -> newHeads or logs
+                pushed       : list[dict]     = []  # Notifications arrived before subscribed
+                while len(subscriptions) < 2:
+                    message: dict = json.loads(ws.recv(timeout=Var.RPC_SUBSCRIBE_TIMEOUT))
+                    if 'id' in message:
+                        if 'error' in message:
+                            Log.Error(self.TAG, f'Failed to subscribe, error: {message["error"]}')
+                            return False
+                        subscriptions[message['result']] = 'newHeads' if 1 == message['id'] else 'logs'
+                    else:
+                        pushed.append(message)
+                Log.Info(self.TAG, f'Subscribed to {url}')
+
+                # Fill the gap, logs pushed meanwhile are skipped by seen
+                head: int = self.pool.call(lambda x: x.w3.eth.block_number)
+                for chunk, logs in self._sequential(self._chunks(self.block, head)):
+                    events: list[tuple[ChecksumAddress, LogEvent]] = self._decode(logs)
+                    for log in logs:
+                        self._remember(log)
+                    self._deliver(events, chunk[0], chunk[1])
+                if head >= self.block:
+                    self._progress(head)
+                self.synced = True
+
+                # Deliver pushed logs, in a batch per head
+                heard: Second = UnixTimestamp()  # When the last head arrived
+                while not self.off:
+                    if len(pushed) > 0:
+                        message = pushed.pop(0)
+                    else:
+                        try:
+                            message = json.loads(ws.recv(timeout=1))
+                        except TimeoutError:
+                            if UnixTimestamp() - heard > Var.RPC_SUBSCRIBE_TIMEOUT:
+                                Log.Warn(self.TAG, f'No new head for {Var.RPC_SUBSCRIBE_TIMEOUT}s, fall back to polling')
+                                break
+                            continue
+                    params: dict = message.get('params', {})
+                    kind  : str  = subscriptions.get(params.get('subscription'), '')
+                    result: dict = params.get('result', {})
+                    if 'newHeads' == kind:
+                        heard  = UnixTimestamp()
+                        heads += 1
+                        number: int = int(result['number'], 16)
+                        if number - 1 >= self.block:
+                            self._deliver([(contract, event) for block, contract, event in pending if block < number], self.block, number - 1)
+                            pending = [x for x in pending if x[0] >= number]
+                            self._progress(number - 1)
+                    elif 'logs' == kind:
+                        if result.get('removed', False):
+                            Log.Warn(self.TAG, f'Log removed by reorganization: {result}')
+                            continue
+                        log: dict = {
+                            'address'        : Web3.to_checksum_address(result['address']),
+                            'topics'         : [HexBytes(x) for x in result['topics']],
+                            'data'           : HexBytes(result['data']),
+                            'blockNumber'    : int(result['blockNumber'], 16),
+                            'transactionHash': HexBytes(result['transactionHash']),
+                            'logIndex'       : int(result['logIndex'], 16),
+                        }
+                        if self._seen(log):
+                            continue
+                        if log['blockNumber'] < self.contracts.get(log['address'], 0):
+                            Log.Warn(self.TAG, f'Log of block {log["blockNumber"]} arrived after the block is done, fall back to polling to refetch it')
+                            late = (log['address'], log['blockNumber'])
+                            break
+                        for contract, event in self._decode([log]):
+                            pending.append((log['blockNumber'], contract, event))
+                        self._remember(log)
+            except Exception as e:
+                Log.Warn(self.TAG, f'Subscription closed, fall back to polling, error: {e}')
+
+            # Pushed logs are not fetched again by polling
+            if len(pending) > 0:
+                self._deliver([(contract, event) for _, contract, event in pending], self.block, max(x[0] for x in pending))
+
+            # Rewind the contract to the block of the late log, logs of it already delivered are skipped by seen
+            if late is not None:
+                self.contracts[late[0]] = late[1]
+                self.block              = min(self.contracts.values())
+        return heads > 0
+
+    '''
+    Split blocks into chunks, both ends inclusive, size of each chunk is taken when it is requested
+    '''
+    def _chunks(self, start: int, end: int) -> Iterator[tuple[int, int]]:
+        while start <= end:
+            chunk: tuple[int, int] = (start, min(start + self.pool.chunk_size() - 1, end))
+            yield chunk
+            start = chunk[1] + 1
+
+    '''
+    Get logs of a chunk, retry until succeed.
+    On size-limit errors the next endpoint is tried first, the chunk is split in halves once all endpoints failed.
+    @return Logs, None if stopped
+    '''
+    def _get_logs(self, chunk: tuple[int, int]) -> list[LogReceipt] | None:
+        blocks : int               = chunk[1] - chunk[0] + 1
+        limited: list[RpcEndpoint] = []  # Endpoints failed by size limit in this attempt
+
+        def fetch(endpoint: RpcEndpoint) -> list[LogReceipt]:
+            begin: Second = UnixTimestamp()
+            try:
+                logs: list[LogReceipt] = endpoint.w3.eth.get_logs({
+                    'address'  : list(self.contracts),
+                    'fromBlock': chunk[0],
+                    'toBlock'  : chunk[1],
+                    'topics'   : self.events,
+                })
+            except Exception as e:
+                if ChunkSizer.is_limit(e):
+                    endpoint.sizer.fail(blocks)
+                    limited.append(endpoint)
+                raise
+            endpoint.sizer.succeed(blocks, len(logs), Second(UnixTimestamp() - begin))
+            return logs
+
+        while not self.off:
+            self.limiter.acquire()
+            limited.clear()
+            try:
+                return self.pool.call(fetch)
+            except Exception as e:
+                if blocks > 1 and len(limited) > 0:
+                    Log.Warn(self.TAG, f'Split {blocks} blocks from {chunk[0]}, error: {e}')
+                    middle: int                     = chunk[0] + blocks // 2 - 1
+                    left  : list[LogReceipt] | None = self._get_logs((chunk[0], middle))
+                    right : list[LogReceipt] | None = None if left is None else self._get_logs((middle + 1, chunk[1]))
+                    return None if right is None else left + right
+                Log.Error(self.TAG, f'Failed to get logs, error: {e}')
+                Log.Info(self.TAG, f'Wait {Var.RPC_RETRY_INTERVAL}s and retry')
+                Sleep(Var.RPC_RETRY_INTERVAL, self.cond)
+        return None
+
+    def _sequential(self, chunks: Iterator[tuple[int, int]]) -> Iterator[tuple[tuple[int, int], list[LogReceipt]]]:
+        for chunk in chunks:
+            logs: list[LogReceipt] | None = self._get_logs(chunk)
+            if logs is None:
+                return
+            yield chunk, logs
+
+            # Prevent reach the rate limit
+            Sleep(Var.RPC_QUERY_INTERVAL, self.cond)
+
+    '''
+    Fetch chunks concurrently, at most 2 chunks per worker ahead of the one being processed,
+    results are yielded in chunk order
+    '''
+    def _backfill(self, chunks: Iterator[tuple[int, int]]) -> Iterator[tuple[tuple[int, int], list[LogReceipt]]]:
+        def fetch(chunk: tuple[int, int]) -> list[LogReceipt] | None:
+            if self.off:
+                return None
+            return self._get_logs(chunk)
+
+        Log.Info(self.TAG, f'Backfill with {self.workers} workers')
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.TAG) as executor:
+            pending: deque[tuple[tuple[int, int], Future]] = deque()
+            try:
+                while True:
+                    for chunk in chunks:
+                        pending.append((chunk, executor.submit(fetch, chunk)))
+                        if len(pending) >= self.workers * 2:
+                            break
+                    if 0 == len(pending):
+                        return
+                    chunk, future = pending.popleft()
+                    logs: list[LogReceipt] | None = future.result()
+                    if logs is None:
+                        return
+                    yield chunk, logs
+            finally:
+                for _, future in pending:
+                    future.cancel()
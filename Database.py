@@ -1,33 +1,109 @@
+import hashlib
+import math
+import mmap
 import os
+import queue
 import sqlite3
+import struct
 import threading as TR
+import urllib.request
+import zlib
 from enum import Enum
 from hexbytes import HexBytes
-from typing import Any
+from typing import Any, Callable, Iterator
 
 import Log
+import Var
 from Executor import Job, TaskQueue
-from Types import EventDeposit, EventWithdraw
+from Types import EventDeposit, EventWithdraw, Second
+from Utils import UnixTimestamp
 
 
 TABLE_STRUCTURE: dict = {
     'EventDeposit' : {
         'columns': ['timestamp', 'blk_num', 'tx_hash', 'commitment', 'leaf_index'],
-        'types'  : ['INTEGER', 'INTEGER', 'TEXT', 'TEXT', 'INTEGER'],
+        'types'  : ['INTEGER', 'INTEGER', 'BLOB', 'BLOB', 'INTEGER'],
+        'unique' : ['leaf_index', 'commitment'],
+        'indexes': ['blk_num'],
     },
     'EventWithdraw': {
         'columns': ['blk_num', 'tx_hash', 'nullifier_hash', 'to', 'fee'],
-        'types'  : ['INTEGER', 'TEXT', 'TEXT', 'TEXT', 'INTEGER'],
+        'types'  : ['INTEGER', 'BLOB', 'BLOB', 'BLOB', 'INTEGER'],
+        'unique' : ['nullifier_hash'],
+        'indexes': ['blk_num'],
     },
     'Info': {
         'columns': ['latest_blk_num', 'latest_leaf_index', 'unspent'],
         'types'  : ['INTEGER', 'INTEGER', 'INTEGER'],
+        'unique' : [],
+        'indexes': [],
     }
 }
 
+# Stored in PRAGMA user_version, databases of older versions are migrated on open
+# 1: Unique indexes on event keys, duplicated rows removed
+# 2: Hashes and addresses stored as BLOB instead of 0x-prefixed hex TEXT
+SCHEMA_VERSION: int = 2
+
+
+'''
+Convert 0x-prefixed hex string to bytes, other values are returned as is
+'''
+def _unhex0x(value: Any) -> Any:
+    if isinstance(value, str):
+        return bytes.fromhex(value[2:] if value.startswith('0x') else value)
+    return value
+
 
 class Backend(Enum):
     SQLITE = 'sqlite'
+    RECORD = 'record'
+
+
+class BloomFilter(object):
+
+    '''
+    Scalable bloom filter, a new filter of double capacity is added when the last one is full,
+    so the false positive rate stays under error_rate * 2 however many items are added.
+    Positions are derived from one blake2b digest by double hashing.
+    @param capacity     Items of the first filter
+    @param error_rate   False positive rate of the first filter, halved for every next one
+    '''
+    def __init__(self, capacity: int = 1 << 16, error_rate: float = 0.001) -> None:
+        self.capacity  : int                                   = max(1, capacity)
+        self.error_rate: float                                 = error_rate
+        self.count     : int                                   = 0   # Items in the last filter
+        self.filters   : list[tuple[bytearray, int, int, int]] = []  # [(bits, size of bits, hashes, capacity)]
+        self._grow()
+
+    def _grow(self) -> None:
+        capacity  : int   = self.capacity << len(self.filters)
+        error_rate: float = self.error_rate / (1 << len(self.filters))
+        size      : int   = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        hashes    : int   = max(1, round(size / capacity * math.log(2)))
+        self.filters.append((bytearray((size + 7) // 8), size, hashes, capacity))
+        self.count = 0
+
+    @staticmethod
+    def _positions(item: bytes, size: int, hashes: int) -> Iterator[int]:
+        digest: bytes = hashlib.blake2b(item, digest_size=16).digest()
+        h1    : int   = int.from_bytes(digest[:8], 'little')
+        h2    : int   = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % size for i in range(0, hashes))
+
+    def add(self, item: bytes) -> None:
+        if self.count >= self.filters[-1][3]:
+            self._grow()
+        bits, size, hashes, _ = self.filters[-1]
+        for position in self._positions(item, size, hashes):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: bytes) -> bool:
+        for bits, size, hashes, _ in self.filters:
+            if all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item, size, hashes)):
+                return True
+        return False
 
 
 class InterfaceClient(object):
@@ -54,7 +130,7 @@ class InterfaceClient(object):
 
     '''
     Get latest leaf index
-    @return Latest synced leaf index
+    @return Latest synced leaf index, -1 if no deposit
             None if error occurred
     '''
     def get_latest_leaf(self) -> int | None:
@@ -78,6 +154,61 @@ class InterfaceClient(object):
     def get_leafs(self, index_start: int, index_end: int) -> list[HexBytes] | None:
         raise NotImplementedError
 
+    '''
+    Stream commitments by leaf index, without materializing the whole range
+    @param  index_start     Start from which leaf index (inclusive)
+    @param  index_end       End at which leaf index (inclusive)
+    @param  chunk           Max number of commitments per yield
+    @return Iterator of lists of 32 bytes commitments, stops early if error occurred
+    '''
+    def iter_leafs(self, index_start: int, index_end: int, chunk: int = 4096) -> Iterator[list[bytes]]:
+        raise NotImplementedError
+
+    '''
+    Stream deposits in leaf index order
+    @param  block_end   Only deposits up to which block number (inclusive)
+    @param  chunk       Max number of events per yield
+    @return Iterator of lists of events, stops early if error occurred
+    '''
+    def iter_deposits(self, block_end: int, chunk: int = 4096) -> Iterator[list[EventDeposit]]:
+        raise NotImplementedError
+
+    '''
+    Stream withdraws in insertion order
+    @param  block_end   Only withdraws up to which block number (inclusive)
+    @param  chunk       Max number of events per yield
+    @return Iterator of lists of events, stops early if error occurred
+    '''
+    def iter_withdraws(self, block_end: int, chunk: int = 4096) -> Iterator[list[EventWithdraw]]:
+        raise NotImplementedError
+
+    '''
+    Count events, to check that iter_deposits() and iter_withdraws() did not stop early
+    @param  block_end   Only events up to which block number (inclusive)
+    @return (deposits, withdraws)
+            None if error occurred
+    '''
+    def count_events(self, block_end: int) -> tuple[int, int] | None:
+        raise NotImplementedError
+
+    '''
+    Check whether a nullifier hash is withdrawn
+    @param  nullifier_hash  0x-prefixed hex string or 32 bytes
+    @return True if spent, False if not
+            None if error occurred
+    '''
+    def is_spent(self, nullifier_hash: str | bytes) -> bool | None:
+        result: list[bool] | None = self.are_spent([nullifier_hash])
+        return None if result is None else result[0]
+
+    '''
+    Check whether nullifier hashes are withdrawn
+    @return List of whether spent, same order as nullifier_hashes
+            None if error occurred
+    '''
+    def are_spent(self, nullifier_hashes: list[str | bytes]) -> list[bool] | None:
+        raise NotImplementedError
+
     def set_latest_block(self, block: int) -> bool:
         raise NotImplementedError
 
@@ -87,17 +218,55 @@ class InterfaceClient(object):
     def add_withdraw(self, event: EventWithdraw) -> bool:
         raise NotImplementedError
 
+    '''
+    Add deposits in one transaction
+    @return True on succeed
+            False if error occurred, nothing is added
+    '''
+    def add_deposits(self, events: list[EventDeposit]) -> bool:
+        raise NotImplementedError
+
+    '''
+    Add withdraws in one transaction
+    @return True on succeed
+            False if error occurred, nothing is added
+    '''
+    def add_withdraws(self, events: list[EventWithdraw]) -> bool:
+        raise NotImplementedError
+
+    '''
+    Add events and move latest block in one transaction, so a resume from latest block never misses events
+    @param  block   Latest block number which all events up to are included
+    @return True on succeed
+            False if error occurred, nothing is changed
+    '''
+    def commit(self, deposits: list[EventDeposit], withdraws: list[EventWithdraw], block: int) -> bool:
+        raise NotImplementedError
+
 
 class SQLiteClient(InterfaceClient):
 
-    def __init__(self):
+    '''
+    Writes go through one connection on the task queue thread,
+    reads use a pool of read-only connections in the caller thread, which WAL lets run beside the writer.
+    @param readers          Number of read-only connections
+    @param statement_cache  Number of prepared statements cached per connection
+    '''
+    def __init__(self, readers: int = 4, statement_cache: int = 128):
         super().__init__(Backend.SQLITE)
         self.TAG: str = __class__.__name__
-        self.mutex      : TR.Lock                   = TR.Lock()
-        self.opened     : bool                      = False
-        self.taskq      : TaskQueue                 = TaskQueue()
-        self.connection : sqlite3.Connection | None = None
-        self.cursor     : sqlite3.Cursor | None     = None
+        self.mutex          : TR.Lock                                    = TR.Lock()
+        self.opened         : bool                                       = False
+        self.taskq          : TaskQueue                                  = TaskQueue()
+        self.connection     : sqlite3.Connection | None                  = None
+        self.cursor         : sqlite3.Cursor | None                      = None
+        self.pool_size      : int                                        = max(1, readers)
+        self.pool_open      : int                                        = 0  # Read connections opened
+        self.pool           : queue.LifoQueue[sqlite3.Connection | None] = queue.LifoQueue()
+        self.pool_mutex     : TR.Lock                                    = TR.Lock()
+        self.pool_lent      : set[sqlite3.Connection]                    = set()  # Read connections taken from pool
+        self.statement_cache: int                                        = statement_cache
+        self.nullifiers     : BloomFilter                                = BloomFilter()  # Withdrawn nullifier hashes
 
     def open(self, url: str) -> bool:
         with self.mutex:
@@ -116,74 +285,217 @@ class SQLiteClient(InterfaceClient):
             # Create and open database
             def _() -> None:
                 try:
-                    self.connection = sqlite3.connect(url)
+                    self.connection = sqlite3.connect(url, cached_statements=self.statement_cache)
+                    self.connection.create_function('unhex0x', 1, _unhex0x, deterministic=True)
                     self.connection.execute('PRAGMA cache_size=20971520;')  # 20 GB
                     self.connection.execute('PRAGMA synchronous=OFF;')  # Or 'NORMAL' for better safety but slower
                     self.connection.execute('PRAGMA journal_mode=WAL;')
                     self.connection.execute('PRAGMA temp_store=MEMORY;')
+                    # Tables created here already have the current schema, only existing ones are migrated
+                    created: bool = 0 == self.connection.execute(
+                        f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ({', '.join('?' * len(TABLE_STRUCTURE))});",
+                        tuple(TABLE_STRUCTURE)).fetchone()[0]
                     for table_name, table_structure in TABLE_STRUCTURE.items():
-                        sql: str = f'CREATE TABLE IF NOT EXISTS {table_name} ('
-                        for column, type_ in zip(table_structure['columns'], table_structure['types']):
-                            sql += f'{column} {type_}, '
-                        sql = sql[:-2] + ')'
-                        self.connection.execute(sql)
+                        self._create_table(self.connection, table_name, table_structure)
                     self.connection.execute('INSERT INTO Info (latest_blk_num, unspent) SELECT 0, 0 WHERE NOT EXISTS (SELECT * FROM Info);')
+                    if not created:
+                        self._migrate(self.connection)
+                    for table_name, table_structure in TABLE_STRUCTURE.items():
+                        for column in table_structure['unique']:
+                            self.connection.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {table_name}_{column} ON {table_name} ("{column}");')
+                        for column in table_structure['indexes']:
+                            self.connection.execute(f'CREATE INDEX IF NOT EXISTS {table_name}_{column} ON {table_name} ("{column}");')
+                    self.connection.execute(f'PRAGMA user_version={SCHEMA_VERSION};')
                     self.connection.commit()
+                    withdraws: int = self.connection.execute('SELECT COUNT(*) FROM EventWithdraw;').fetchone()[0]
+                    self.nullifiers = BloomFilter(max(withdraws * 2, 1 << 16))
+                    for x, in self.connection.execute('SELECT nullifier_hash FROM EventWithdraw;'):
+                        self.nullifiers.add(x)
                     self.cursor = self.connection.cursor()
                     self.opened = True
                 except Exception as e_:
                     Log.Error(self.TAG, f'Open database exception, error: {e_}')
             self.taskq.run_sync(Job('open', _))
 
+            # Open read-only connections
+            if self.opened:
+                try:
+                    uri: str = f'file:{urllib.request.pathname2url(os.path.abspath(url))}?mode=ro'
+                    self.pool = queue.LifoQueue()
+                    for _ in range(0, self.pool_size):
+                        self.pool.put(sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=self.statement_cache))
+                        self.pool_open += 1
+                except Exception as e:
+                    Log.Error(self.TAG, f'Open read connection exception, error: {e}')
+                    self.opened = False
+                    self._close()
+            else:
+                self.taskq.stop()
+
             return self.opened
 
+    '''
+    Migrate tables of an older schema version in place, before indexes are created
+    '''
+    def _migrate(self, connection: sqlite3.Connection) -> None:
+        version: int = connection.execute('PRAGMA user_version;').fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+
+        # 1: Remove rows duplicated by re-processed blocks, keep the first one, then fix counters
+        if version < 1:
+            removed: int = 0
+            for table_name, table_structure in TABLE_STRUCTURE.items():
+                for column in table_structure['unique']:
+                    removed += connection.execute(f'DELETE FROM {table_name} WHERE rowid NOT IN (SELECT MIN(rowid) FROM {table_name} GROUP BY "{column}");').rowcount
+            if removed > 0:
+                Log.Warn(self.TAG, f'Removed {removed} duplicated events')
+                connection.execute('UPDATE Info SET unspent = (SELECT COUNT(*) FROM EventDeposit) - (SELECT COUNT(*) FROM EventWithdraw), '
+                                   'latest_leaf_index = (SELECT MAX(leaf_index) FROM EventDeposit);')
+
+        # 2: Rebuild event tables with BLOB columns, the declared type of a column can not be altered
+        if version < 2:
+            rebuilt: bool = False
+            for table_name, table_structure in TABLE_STRUCTURE.items():
+                declared: dict[str, str] = {row[1]: row[2] for row in connection.execute(f'PRAGMA table_info({table_name});')}
+                columns : list[str]      = [f'unhex0x("{column}")' if 'BLOB' == type_ != declared[column] else f'"{column}"'
+                                            for column, type_ in zip(table_structure['columns'], table_structure['types'])]
+                if all(column.startswith('"') for column in columns):
+                    continue
+                connection.execute(f'DROP TABLE IF EXISTS {table_name}_v2;')
+                self._create_table(connection, f'{table_name}_v2', table_structure)
+                connection.execute(f'INSERT INTO {table_name}_v2 SELECT {", ".join(columns)} FROM {table_name};')
+                connection.execute(f'DROP TABLE {table_name};')
+                connection.execute(f'ALTER TABLE {table_name}_v2 RENAME TO {table_name};')
+                rebuilt = True
+            if rebuilt:
+                # Give space of the TEXT tables back, VACUUM can not run inside a transaction
+                connection.commit()
+                connection.execute('VACUUM;')
+
+        Log.Info(self.TAG, f'Migrated database from version {version} to {SCHEMA_VERSION}')
+
+    @staticmethod
+    def _create_table(connection: sqlite3.Connection, table_name: str, table_structure: dict) -> None:
+        sql: str = f'CREATE TABLE IF NOT EXISTS {table_name} ('
+        for column, type_ in zip(table_structure['columns'], table_structure['types']):
+            sql += f'"{column}" {type_}, '
+        sql = sql[:-2] + ')'
+        connection.execute(sql)
+
     def close(self) -> None:
         with self.mutex:
             if not self.opened:
                 Log.Warn(self.TAG, f'Already closed')
                 return
-            def _() -> None:
-                try:
-                    self.cursor.close()
-                    self.connection.close()
-                except Exception as e:
-                    Log.Error(self.TAG, f'Close database exception, error: {e}')
-                self.opened     = False
-                self.cursor     = None
-                self.connection = None
-            self.taskq.run_sync(Job('close', _))
+            self.opened = False
+            self._close()
+
+    def _close(self) -> None:
+        # Wait for queries in progress to return their connections, an iterator left unfinished may never return it
+        deadline: Second = Second(UnixTimestamp() + Var.DB_CLOSE_TIMEOUT)
+        for _ in range(0, self.pool_open):
+            try:
+                self.pool.get(timeout=max(0.0, deadline - UnixTimestamp())).close()
+            except queue.Empty:
+                break
+        with self.pool_mutex:
+            if 0 != len(self.pool_lent):
+                Log.Warn(self.TAG, f'Closing {len(self.pool_lent)} read connections not returned in {Var.DB_CLOSE_TIMEOUT}s')
+            for connection in self.pool_lent:
+                connection.close()
+            self.pool_lent.clear()
+            while not self.pool.empty():
+                self.pool.get_nowait().close()
+        # Leave None to fail later queries
+        self.pool_open = 0
+        for _ in range(0, self.pool_size):
+            self.pool.put(None)
+
+        def _() -> None:
+            try:
+                self.cursor.close()
+                self.connection.close()
+            except Exception as e:
+                Log.Error(self.TAG, f'Close database exception, error: {e}')
+            self.cursor     = None
+            self.connection = None
+        self.taskq.run_sync(Job('close', _))
+        self.taskq.stop()
 
     def get_latest_block(self) -> int | None:
         sql: str = 'SELECT latest_blk_num FROM Info;'
-        with self.mutex:
-            result: list[int] | None = self._query(sql)
-            if result is None:
-                return None
-            return result[0]
+        result: list[tuple[int]] | None = self._query(sql)
+        if result is None:
+            return None
+        return result[0][0]
 
     def get_latest_leaf(self) -> int | None:
-        sql: str = 'SELECT latest_leaf_index FROM Info;'
-        with self.mutex:
-            result: list[int] | None = self._query(sql)
-            if result is None:
-                return None
-            return result[0]
+        sql: str = 'SELECT COALESCE(latest_leaf_index, -1) FROM Info;'
+        result: list[tuple[int]] | None = self._query(sql)
+        if result is None:
+            return None
+        return result[0][0]
 
     def get_unspent(self) -> int | None:
         sql: str = 'SELECT unspent FROM Info;'
-        with self.mutex:
-            result: list[int] | None = self._query(sql)
-            if result is None:
-                return None
-            return result[0]
+        result: list[tuple[int]] | None = self._query(sql)
+        if result is None:
+            return None
+        return result[0][0]
 
     def get_leafs(self, index_start: int, index_end: int) -> list[HexBytes] | None:
-        sql: str = f'SELECT commitment FROM EventDeposit WHERE leaf_index BETWEEN {index_start} AND {index_end};'
-        with self.mutex:
-            result: list[str] | None = self._query(sql)
-            if result is None:
+        sql: str = 'SELECT commitment FROM EventDeposit WHERE leaf_index BETWEEN ? AND ? ORDER BY leaf_index;'
+        result: list[tuple[bytes]] | None = self._query(sql, (index_start, index_end))
+        if result is None:
+            return None
+        return [HexBytes(x) for x, in result]
+
+    def are_spent(self, nullifier_hashes: list[str | bytes]) -> list[bool] | None:
+        if not self.opened:
+            Log.Error(self.TAG, f'Database not opened')
+            return None
+
+        keys  : list[bytes] = [_unhex0x(x) for x in nullifier_hashes]
+        result: list[bool]  = [False] * len(keys)
+        # Only hits of the filter are looked up, most of them are really spent
+        hits: dict[bytes, list[int]] = {}
+        for i, key in enumerate(keys):
+            if key in self.nullifiers:
+                hits.setdefault(key, []).append(i)
+        candidates: list[bytes] = list(hits)
+        for i in range(0, len(candidates), 500):
+            batch: list[bytes]               = candidates[i:i + 500]
+            sql  : str                       = f'SELECT nullifier_hash FROM EventWithdraw WHERE nullifier_hash IN ({", ".join("?" * len(batch))});'
+            rows : list[tuple[bytes]] | None = self._query(sql, tuple(batch))
+            if rows is None:
                 return None
-            return [HexBytes.fromhex(x[2:] if x.startswith('0x') else x) for x in result]
+            for x, in rows:
+                for index in hits[x]:
+                    result[index] = True
+        return result
+
+    def iter_leafs(self, index_start: int, index_end: int, chunk: int = 4096) -> Iterator[list[bytes]]:
+        sql: str = 'SELECT commitment FROM EventDeposit WHERE leaf_index BETWEEN ? AND ? ORDER BY leaf_index;'
+        for rows in self._iter(sql, (index_start, index_end), chunk):
+            yield [x for x, in rows]
+
+    def iter_deposits(self, block_end: int, chunk: int = 4096) -> Iterator[list[EventDeposit]]:
+        sql: str = 'SELECT timestamp, blk_num, tx_hash, commitment, leaf_index FROM EventDeposit WHERE blk_num <= ? ORDER BY leaf_index;'
+        for rows in self._iter(sql, (block_end,), chunk):
+            yield [EventDeposit(timestamp, blk_num, tx_hash.hex(), commitment.hex(), leaf_index) for timestamp, blk_num, tx_hash, commitment, leaf_index in rows]
+
+    def iter_withdraws(self, block_end: int, chunk: int = 4096) -> Iterator[list[EventWithdraw]]:
+        sql: str = 'SELECT blk_num, tx_hash, nullifier_hash, "to", fee FROM EventWithdraw WHERE blk_num <= ? ORDER BY rowid;'
+        for rows in self._iter(sql, (block_end,), chunk):
+            yield [EventWithdraw(blk_num, tx_hash.hex(), nullifier_hash.hex(), to.hex(), fee) for blk_num, tx_hash, nullifier_hash, to, fee in rows]
+
+    def count_events(self, block_end: int) -> tuple[int, int] | None:
+        sql: str = 'SELECT (SELECT COUNT(*) FROM EventDeposit WHERE blk_num <= ?), (SELECT COUNT(*) FROM EventWithdraw WHERE blk_num <= ?);'
+        result: list[tuple[int, int]] | None = self._query(sql, (block_end, block_end))
+        if result is None:
+            return None
+        return result[0]
 
     def set_latest_block(self, block: int) -> bool:
         sql: str = f'UPDATE Info SET latest_blk_num = {block};'
@@ -191,39 +503,124 @@ class SQLiteClient(InterfaceClient):
             return self._insert([sql])
 
     def add_deposit(self, event: EventDeposit) -> bool:
-        sql: list[str] = [
-            f'INSERT INTO EventDeposit VALUES ({event.timestamp}, {event.blk_num}, "{event.tx_hash}", "{event.commitment}", {event.leaf_index});',
-            f'UPDATE Info SET unspent = unspent + 1;',
-            f'UPDATE Info SET latest_leaf_index = {event.leaf_index} WHERE latest_leaf_index < {event.leaf_index};',
-            f'UPDATE Info SET latest_blk_num = {event.blk_num} WHERE latest_blk_num < {event.blk_num};',
-        ]
-        with self.mutex:
-            return self._insert(sql)
+        return self.add_deposits([event])
 
     def add_withdraw(self, event: EventWithdraw) -> bool:
-        sql: list[str] = [
-            f'INSERT INTO EventWithdraw VALUES ({event.blk_num}, "{event.tx_hash}", "{event.nullifier_hash}", "{event.to}", {event.fee});',
-            f'UPDATE Info SET unspent = unspent - 1;',
-        ]
+        return self.add_withdraws([event])
+
+    def add_deposits(self, events: list[EventDeposit]) -> bool:
+        if 0 == len(events):
+            return True
+        blk_num: int = max(e.blk_num for e in events)
+        def _(cursor: sqlite3.Cursor) -> None:
+            self._insert_deposits(cursor, events)
+            cursor.execute('UPDATE Info SET latest_blk_num = ? WHERE latest_blk_num < ?;', (blk_num, blk_num))
+        with self.mutex:
+            return self._transaction('add_deposits', _)
+
+    def add_withdraws(self, events: list[EventWithdraw]) -> bool:
+        if 0 == len(events):
+            return True
         with self.mutex:
-            return self._insert(sql)
+            return self._transaction('add_withdraws', lambda cursor: self._insert_withdraws(cursor, events))
 
-    def _query(self, sql: str) -> list[Any] | None:
+    def commit(self, deposits: list[EventDeposit], withdraws: list[EventWithdraw], block: int) -> bool:
+        def _(cursor: sqlite3.Cursor) -> None:
+            self._insert_deposits(cursor, deposits)
+            self._insert_withdraws(cursor, withdraws)
+            cursor.execute('UPDATE Info SET latest_blk_num = ? WHERE latest_blk_num < ?;', (block, block))
+        with self.mutex:
+            return self._transaction('commit', _)
+
+    @staticmethod
+    def _insert_deposits(cursor: sqlite3.Cursor, events: list[EventDeposit]) -> None:
+        if 0 == len(events):
+            return
+        rows      : list[tuple] = [(e.timestamp, e.blk_num, _unhex0x(e.tx_hash), _unhex0x(e.commitment), e.leaf_index) for e in events]
+        leaf_index: int         = max(e.leaf_index for e in events)
+        # Events already stored by a replayed block range are ignored and not counted
+        cursor.executemany('INSERT OR IGNORE INTO EventDeposit VALUES (?, ?, ?, ?, ?);', rows)
+        cursor.execute('UPDATE Info SET unspent = unspent + ?;', (cursor.rowcount,))
+        cursor.execute('UPDATE Info SET latest_leaf_index = ? WHERE latest_leaf_index IS NULL OR latest_leaf_index < ?;', (leaf_index, leaf_index))
+
+    def _insert_withdraws(self, cursor: sqlite3.Cursor, events: list[EventWithdraw]) -> None:
+        if 0 == len(events):
+            return
+        rows: list[tuple] = [(e.blk_num, _unhex0x(e.tx_hash), _unhex0x(e.nullifier_hash), _unhex0x(e.to), e.fee) for e in events]
+        # Add to filter before commit, a rollback only leaves false positives which are checked in database
+        for row in rows:
+            self.nullifiers.add(row[2])
+        cursor.executemany('INSERT OR IGNORE INTO EventWithdraw VALUES (?, ?, ?, ?, ?);', rows)
+        cursor.execute('UPDATE Info SET unspent = unspent - ?;', (cursor.rowcount,))
+
+    def _query(self, sql: str, params: tuple = ()) -> list[Any] | None:
         if not self.opened:
             Log.Error(self.TAG, f'Database not opened')
             return None
 
-        result: list[Any] | None = None
-        def _() -> None:
-            nonlocal result
+        connection: sqlite3.Connection | None = self._borrow()
+        try:
+            if connection is None:
+                Log.Error(self.TAG, f'Database not opened')
+                return None
+            return connection.execute(sql, params).fetchall()
+        except Exception as e:
+            Log.Error(self.TAG, f'Query exception, sql: {sql}, error: {e}')
+            return None
+        finally:
+            self._return(connection)
+
+    '''
+    Run query on one read connection held until the iterator is exhausted or closed, yield rows in chunks
+    '''
+    def _iter(self, sql: str, params: tuple, chunk: int) -> Iterator[list[Any]]:
+        if not self.opened:
+            Log.Error(self.TAG, f'Database not opened')
+            return
+
+        connection: sqlite3.Connection | None = self._borrow()
+        try:
+            if connection is None:
+                Log.Error(self.TAG, f'Database not opened')
+                return
+            cursor: sqlite3.Cursor = connection.execute(sql, params)
             try:
-                self.cursor.execute(sql)
-                result = self.cursor.fetchall()
-            except Exception as e:
-                Log.Error(self.TAG, f'Query exception, sql: {sql}, error: {e}')
-        self.taskq.run_sync(Job('Query', _))
+                while True:
+                    rows: list[Any] = cursor.fetchmany(chunk)
+                    if 0 == len(rows):
+                        break
+                    yield rows
+            finally:
+                cursor.close()
+        except Exception as e:
+            Log.Error(self.TAG, f'Query exception, sql: {sql}, error: {e}')
+        finally:
+            self._return(connection)
 
-        return result
+    '''
+    Take a read connection from pool, wait if all are in use
+    @return None if database closed
+    '''
+    def _borrow(self) -> sqlite3.Connection | None:
+        connection: sqlite3.Connection | None = self.pool.get()
+        if connection is not None:
+            with self.pool_mutex:
+                self.pool_lent.add(connection)
+        return connection
+
+    '''
+    Put a read connection back to pool, or close it if close() gave up waiting for it
+    '''
+    def _return(self, connection: sqlite3.Connection | None) -> None:
+        if connection is None:
+            self.pool.put(None)
+            return
+        with self.pool_mutex:
+            if connection in self.pool_lent:
+                self.pool_lent.remove(connection)
+                self.pool.put(connection)
+                return
+        connection.close()
 
     def _insert(self, sql: list[str]) -> bool:
         if not self.opened:
@@ -245,12 +642,704 @@ class SQLiteClient(InterfaceClient):
 
         return succeed
 
+    '''
+    Run task with the cursor in one transaction on the worker thread, rollback if it raises
+    '''
+    def _transaction(self, name: str, task: Callable[[sqlite3.Cursor], None]) -> bool:
+        if not self.opened:
+            Log.Error(self.TAG, f'Database not opened')
+            return False
+
+        succeed: bool = True
+        def _() -> None:
+            nonlocal succeed
+            try:
+                task(self.cursor)
+                self.connection.commit()
+            except Exception as e:
+                Log.Error(self.TAG, f'Transaction {name} exception, error: {e}')
+                self.connection.rollback()
+                succeed = False
+        self.taskq.run_sync(Job(name, _))
+
+        return succeed
+
+
+class RecordClient(InterfaceClient):
+
+    MAGIC      : bytes         = b'TCRECDB1'
+    HEADER     : struct.Struct = struct.Struct('<8sQqqqq')  # magic, capacity, latest block, latest leaf (-1 if none), unspent, withdraws
+    HEADER_SIZE: int           = 64
+    DEPOSIT    : struct.Struct = struct.Struct('<QQ32s32s')  # timestamp, block, tx hash, commitment
+    WITHDRAW   : struct.Struct = struct.Struct('<Q32s32s20s32s')  # block, tx hash, nullifier hash, to, fee
+    COMMITMENT : int           = 48  # Offset of commitment in deposit record
+    NULLIFIER  : int           = 40  # Offset of nullifier hash in withdraw record
+    EMPTY      : bytes         = bytes(32)
+
+    '''
+    Append-only store of fixed-width records in memory-mapped files, for events keyed by dense leaf index.
+    Directory url holds Info counters in a header file, deposits at slot leaf_index and withdraws in arrival order.
+    Files are sparse and reserved for capacity records, blocks are allocated when written.
+    Records are written before the header, so records after the header counters are leftovers of an interrupted write
+    and are cleared on open.
+    @param capacity     Max number of deposits and withdraws, 2 ** 20 of the tree height
+    '''
+    def __init__(self, capacity: int = 2 ** 20):
+        super().__init__(Backend.RECORD)
+        self.TAG       : str                    = __class__.__name__
+        self.mutex     : TR.Lock                = TR.Lock()
+        self.opened    : bool                   = False
+        self.capacity  : int                    = capacity
+        self.info      : mmap.mmap | None       = None
+        self.deposits  : mmap.mmap | None       = None
+        self.withdraws : mmap.mmap | None       = None
+        self.nullifiers: dict[bytes, int]       = {}  # Nullifier hash -> withdraw record index
+
+    def open(self, url: str) -> bool:
+        with self.mutex:
+            if self.opened:
+                Log.Warn(self.TAG, f'Already opened')
+                return True
+            try:
+                os.makedirs(url, exist_ok=True)
+                self.info      = self._map(os.path.join(url, 'info'), RecordClient.HEADER_SIZE)
+                self.deposits  = self._map(os.path.join(url, 'deposits'), self.capacity * RecordClient.DEPOSIT.size)
+                self.withdraws = self._map(os.path.join(url, 'withdraws'), self.capacity * RecordClient.WITHDRAW.size)
+                magic, capacity, _, _, _, _ = RecordClient.HEADER.unpack_from(self.info, 0)
+                if magic == bytes(8):
+                    RecordClient.HEADER.pack_into(self.info, 0, RecordClient.MAGIC, self.capacity, 0, -1, 0, 0)
+                elif magic != RecordClient.MAGIC or capacity != self.capacity:
+                    raise ValueError(f'Incompatible record files, magic: {magic}, capacity: {capacity}')
+                _, _, _, leaf, _, withdraws = RecordClient.HEADER.unpack_from(self.info, 0)
+
+                # Clear records of an interrupted write, they are contiguous after the counted ones
+                for index in range(leaf + 1, self.capacity):
+                    if self._commitment(index) == RecordClient.EMPTY:
+                        break
+                    self._write_deposit(index, bytes(RecordClient.DEPOSIT.size))
+                for index in range(withdraws, self.capacity):
+                    offset: int = index * RecordClient.WITHDRAW.size
+                    if self.withdraws[offset:offset + RecordClient.WITHDRAW.size] == bytes(RecordClient.WITHDRAW.size):
+                        break
+                    self.withdraws[offset:offset + RecordClient.WITHDRAW.size] = bytes(RecordClient.WITHDRAW.size)
+
+                self.nullifiers = {}
+                for index in range(0, withdraws):
+                    self.nullifiers[self._nullifier(index)] = index
+                self.opened = True
+            except Exception as e:
+                Log.Error(self.TAG, f'Open database exception, error: {e}')
+                self._close()
+            return self.opened
+
+    @staticmethod
+    def _map(path: str, length: int) -> mmap.mmap:
+        fd: int = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            size: int = os.fstat(fd).st_size
+            if 0 == size:
+                os.ftruncate(fd, length)  # Sparse
+            elif size != length:
+                raise ValueError(f'Incompatible record file, size: {size}, expect: {length}, path: {path}')
+            return mmap.mmap(fd, length)
+        finally:
+            os.close(fd)
+
+    def close(self) -> None:
+        with self.mutex:
+            if not self.opened:
+                Log.Warn(self.TAG, f'Already closed')
+                return
+            self.opened = False
+            self._close()
+
+    def _close(self) -> None:
+        for buffer in (self.deposits, self.withdraws, self.info):
+            if buffer is not None:
+                buffer.flush()
+                buffer.close()
+        self.info       = None
+        self.deposits   = None
+        self.withdraws  = None
+        self.nullifiers = {}
+
+    def _header(self) -> tuple[int, int, int, int] | None:
+        if not self.opened:
+            Log.Error(self.TAG, f'Database not opened')
+            return None
+        return RecordClient.HEADER.unpack_from(self.info, 0)[2:]
+
+    def get_latest_block(self) -> int | None:
+        header: tuple[int, int, int, int] | None = self._header()
+        return None if header is None else header[0]
+
+    def get_latest_leaf(self) -> int | None:
+        header: tuple[int, int, int, int] | None = self._header()
+        return None if header is None else header[1]
+
+    def get_unspent(self) -> int | None:
+        header: tuple[int, int, int, int] | None = self._header()
+        return None if header is None else header[2]
+
+    def get_leafs(self, index_start: int, index_end: int) -> list[HexBytes] | None:
+        leafs: list[HexBytes] = []
+        for chunk in self.iter_leafs(index_start, index_end):
+            leafs.extend(HexBytes(x) for x in chunk)
+        return leafs if self.opened else None
+
+    def iter_leafs(self, index_start: int, index_end: int, chunk: int = 4096) -> Iterator[list[bytes]]:
+        header: tuple[int, int, int, int] | None = self._header()
+        if header is None:
+            return
+        index_start = max(0, index_start)
+        index_end   = min(index_end, header[1])
+        for start in range(index_start, index_end + 1, chunk):
+            # One slice of the records, then commitments out of it
+            size  : int         = RecordClient.DEPOSIT.size
+            region: bytes       = self.deposits[start * size:min(start + chunk, index_end + 1) * size]
+            leafs : list[bytes] = [region[offset:offset + 32] for offset in range(RecordClient.COMMITMENT, len(region), size)]
+            # Stop at a hole, leafs are contiguous
+            if RecordClient.EMPTY in leafs:
+                leafs = leafs[:leafs.index(RecordClient.EMPTY)]
+                if len(leafs) > 0:
+                    yield leafs
+                return
+            yield leafs
+
+    def iter_deposits(self, block_end: int, chunk: int = 4096) -> Iterator[list[EventDeposit]]:
+        header: tuple[int, int, int, int] | None = self._header()
+        if header is None:
+            return
+        events: list[EventDeposit] = []
+        for index in range(0, header[1] + 1):
+            timestamp, blk_num, tx_hash, commitment = RecordClient.DEPOSIT.unpack_from(self.deposits, index * RecordClient.DEPOSIT.size)
+            if commitment == RecordClient.EMPTY or blk_num > block_end:
+                continue
+            events.append(EventDeposit(timestamp, blk_num, tx_hash.hex(), commitment.hex(), index))
+            if len(events) >= chunk:
+                yield events
+                events = []
+        if len(events) > 0:
+            yield events
+
+    def iter_withdraws(self, block_end: int, chunk: int = 4096) -> Iterator[list[EventWithdraw]]:
+        header: tuple[int, int, int, int] | None = self._header()
+        if header is None:
+            return
+        events: list[EventWithdraw] = []
+        for index in range(0, header[3]):
+            blk_num, tx_hash, nullifier_hash, to, fee = RecordClient.WITHDRAW.unpack_from(self.withdraws, index * RecordClient.WITHDRAW.size)
+            if blk_num > block_end:
+                continue
+            events.append(EventWithdraw(blk_num, tx_hash.hex(), nullifier_hash.hex(), to.hex(), int.from_bytes(fee, 'big')))
+            if len(events) >= chunk:
+                yield events
+                events = []
+        if len(events) > 0:
+            yield events
+
+    def count_events(self, block_end: int) -> tuple[int, int] | None:
+        header: tuple[int, int, int, int] | None = self._header()
+        if header is None:
+            return None
+        deposits: int = 0
+        for index in range(0, header[1] + 1):
+            _, blk_num, _, commitment = RecordClient.DEPOSIT.unpack_from(self.deposits, index * RecordClient.DEPOSIT.size)
+            if commitment != RecordClient.EMPTY and blk_num <= block_end:
+                deposits += 1
+        withdraws: int = 0
+        for index in range(0, header[3]):
+            blk_num, _, _, _, _ = RecordClient.WITHDRAW.unpack_from(self.withdraws, index * RecordClient.WITHDRAW.size)
+            if blk_num <= block_end:
+                withdraws += 1
+        return deposits, withdraws
+
+    def are_spent(self, nullifier_hashes: list[str | bytes]) -> list[bool] | None:
+        if not self.opened:
+            Log.Error(self.TAG, f'Database not opened')
+            return None
+        return [_unhex0x(x) in self.nullifiers for x in nullifier_hashes]
+
+    def set_latest_block(self, block: int) -> bool:
+        return self.commit([], [], block)
+
+    def add_deposit(self, event: EventDeposit) -> bool:
+        return self.add_deposits([event])
+
+    def add_withdraw(self, event: EventWithdraw) -> bool:
+        return self.add_withdraws([event])
+
+    def add_deposits(self, events: list[EventDeposit]) -> bool:
+        if 0 == len(events):
+            return True
+        return self.commit(events, [], max(e.blk_num for e in events))
+
+    def add_withdraws(self, events: list[EventWithdraw]) -> bool:
+        if 0 == len(events):
+            return True
+        return self.commit([], events, 0)
+
+    '''
+    Write records, then the header, events already stored by a replayed block range are ignored and not counted
+    '''
+    def commit(self, deposits: list[EventDeposit], withdraws: list[EventWithdraw], block: int) -> bool:
+        with self.mutex:
+            header: tuple[int, int, int, int] | None = self._header()
+            if header is None:
+                return False
+            latest_block, latest_leaf, unspent, count = header
+            written: list[int] = []  # Leaf indexes written
+            try:
+                for e in deposits:
+                    if not 0 <= e.leaf_index < self.capacity:
+                        raise IndexError(f'Leaf index out of range: {e.leaf_index}')
+                    if self._commitment(e.leaf_index) != RecordClient.EMPTY:
+                        continue
+                    self._write_deposit(e.leaf_index, RecordClient.DEPOSIT.pack(int(e.timestamp), e.blk_num, _unhex0x(e.tx_hash), _unhex0x(e.commitment)))
+                    written.append(e.leaf_index)
+                    latest_leaf = max(latest_leaf, e.leaf_index)
+                    unspent    += 1
+                for e in withdraws:
+                    nullifier: bytes = _unhex0x(e.nullifier_hash)
+                    if nullifier in self.nullifiers:
+                        continue
+                    if count >= self.capacity:
+                        raise IndexError(f'Withdraw records are full')
+                    offset: int = count * RecordClient.WITHDRAW.size
+                    RecordClient.WITHDRAW.pack_into(self.withdraws, offset, e.blk_num, _unhex0x(e.tx_hash), nullifier, _unhex0x(e.to), e.fee.to_bytes(32, 'big'))
+                    self.nullifiers[nullifier] = count
+                    count   += 1
+                    unspent -= 1
+            except Exception as e:
+                # Roll back records written so far, header is not changed
+                Log.Error(self.TAG, f'Commit exception, error: {e}')
+                for index in written:
+                    self._write_deposit(index, bytes(RecordClient.DEPOSIT.size))
+                for index in range(header[3], count):
+                    del self.nullifiers[self._nullifier(index)]
+                    offset: int = index * RecordClient.WITHDRAW.size
+                    self.withdraws[offset:offset + RecordClient.WITHDRAW.size] = bytes(RecordClient.WITHDRAW.size)
+                return False
+            RecordClient.HEADER.pack_into(self.info, 0, RecordClient.MAGIC, self.capacity, max(latest_block, block), latest_leaf, unspent, count)
+            return True
+
+    def _commitment(self, index: int) -> bytes:
+        offset: int = index * RecordClient.DEPOSIT.size + RecordClient.COMMITMENT
+        return self.deposits[offset:offset + 32]
+
+    def _nullifier(self, index: int) -> bytes:
+        offset: int = index * RecordClient.WITHDRAW.size + RecordClient.NULLIFIER
+        return self.withdraws[offset:offset + 32]
+
+    def _write_deposit(self, index: int, record: bytes) -> None:
+        offset: int = index * RecordClient.DEPOSIT.size
+        self.deposits[offset:offset + RecordClient.DEPOSIT.size] = record
+
+
+class WriteBehindClient(InterfaceClient):
+
+    '''
+    Buffer events in memory and write them to the wrapped client with the latest block in one commit,
+    when the buffer reaches max_events or the oldest buffered event is older than max_delay.
+    Reads merge the buffered events, so callers see them before they are written.
+    @param client       Client to write to
+    @param max_events   Flush when this many events are buffered
+    @param max_delay    Flush when the oldest buffered event waits this long
+    '''
+    def __init__(self, client: InterfaceClient, max_events: int = Var.DB_FLUSH_EVENTS, max_delay: Second = Var.DB_FLUSH_INTERVAL):
+        super().__init__(client.backend)
+        self.TAG       : str                            = __class__.__name__
+        self.client    : InterfaceClient                = client
+        self.max_events: int                            = max_events
+        self.max_delay : Second                         = max_delay
+        self.off       : bool                           = True
+        self.cond      : TR.Condition                   = TR.Condition()
+        self.flush_lock: TR.Lock                        = TR.Lock()
+        self.worker    : TR.Thread | None               = None
+        self.time      : Second | None                  = None  # When the oldest buffered event arrived
+        self.block     : int | None                     = None  # Latest block set but not written
+        self.deposits  : dict[int, EventDeposit]        = {}    # Leaf index -> buffered deposit
+        self.withdraws : dict[str, EventWithdraw]       = {}    # Nullifier hash -> buffered withdraw
+        self.flushing  : tuple[dict, dict, int | None]  = ({}, {}, None)  # Being written, still visible to reads
+        self.flushed   : int                            = 0     # Number of finished flushes
+
+    def open(self, url: str) -> bool:
+        if not self.off:
+            Log.Warn(self.TAG, f'Already opened')
+            return True
+        if not self.client.open(url):
+            return False
+        self.off    = False
+        self.worker = TR.Thread(target=self._loop)
+        self.worker.start()
+        return True
+
+    '''
+    Flush buffered events and close the wrapped client
+    '''
+    def close(self) -> None:
+        if self.off:
+            Log.Warn(self.TAG, f'Already closed')
+            return
+        self.off = True
+        with self.cond:
+            self.cond.notify_all()
+        self.worker.join()
+        self.worker = None
+        if not self.flush():
+            Log.Error(self.TAG, f'Drop {len(self.deposits)} deposits and {len(self.withdraws)} withdraws not written')
+        self.client.close()
+
+    def get_latest_block(self) -> int | None:
+        # Read buffer before the wrapped client, a flush in between then only moves data into the client
+        with self.cond:
+            buffered: list[int] = [x for x in (self.block, self.flushing[2]) if x is not None]
+        block: int | None = self.client.get_latest_block()
+        if block is None:
+            return None
+        return max([block] + buffered)
+
+    def get_latest_leaf(self) -> int | None:
+        with self.cond:
+            buffered: list[int] = list(self.deposits) + list(self.flushing[0])
+        leaf: int | None = self.client.get_latest_leaf()
+        if leaf is None:
+            return None
+        return max(buffered + [leaf])
+
+    '''
+    Buffered events are counted even if a replayed block range already wrote them
+    '''
+    def get_unspent(self) -> int | None:
+        # Counts are not monotonic, retry if a flush finished between reading buffer and the wrapped client
+        while True:
+            with self.cond:
+                flushed : int = self.flushed
+                buffered: int = (len(self.deposits) + len(self.flushing[0])
+                               - len(self.withdraws) - len(self.flushing[1]))
+            unspent: int | None = self.client.get_unspent()
+            if unspent is None:
+                return None
+            with self.cond:
+                if flushed == self.flushed:
+                    return unspent + buffered
+
+    def get_leafs(self, index_start: int, index_end: int) -> list[HexBytes] | None:
+        with self.cond:
+            buffered: dict[int, EventDeposit] = self.flushing[0] | self.deposits
+        leafs: list[HexBytes] | None = self.client.get_leafs(index_start, index_end)
+        if leafs is None:
+            return None
+        # Leafs are contiguous, continue from where the wrapped client ends
+        for index in range(index_start + len(leafs), index_end + 1):
+            if index not in buffered:
+                break
+            leafs.append(HexBytes(buffered[index].commitment))
+        return leafs
+
+    '''
+    Buffered events are flushed first
+    '''
+    def iter_deposits(self, block_end: int, chunk: int = 4096) -> Iterator[list[EventDeposit]]:
+        self.flush()
+        return self.client.iter_deposits(block_end, chunk)
+
+    '''
+    Buffered events are flushed first
+    '''
+    def iter_withdraws(self, block_end: int, chunk: int = 4096) -> Iterator[list[EventWithdraw]]:
+        self.flush()
+        return self.client.iter_withdraws(block_end, chunk)
+
+    '''
+    Buffered events are flushed first
+    '''
+    def count_events(self, block_end: int) -> tuple[int, int] | None:
+        self.flush()
+        return self.client.count_events(block_end)
+
+    def are_spent(self, nullifier_hashes: list[str | bytes]) -> list[bool] | None:
+        with self.cond:
+            buffered: set[bytes] = {_unhex0x(x) for x in self.flushing[1]} | {_unhex0x(x) for x in self.withdraws}
+        keys  : list[bytes]       = [_unhex0x(x) for x in nullifier_hashes]
+        result: list[bool] | None = self.client.are_spent([x for x in keys if x not in buffered])
+        if result is None:
+            return None
+        stored: Iterator[bool] = iter(result)
+        return [True if x in buffered else next(stored) for x in keys]
+
+    def iter_leafs(self, index_start: int, index_end: int, chunk: int = 4096) -> Iterator[list[bytes]]:
+        with self.cond:
+            buffered: dict[int, EventDeposit] = self.flushing[0] | self.deposits
+        index: int = index_start
+        for leafs in self.client.iter_leafs(index_start, index_end, chunk):
+            index += len(leafs)
+            yield leafs
+        # Leafs are contiguous, continue from where the wrapped client ends
+        leafs: list[bytes] = []
+        while index <= index_end and index in buffered:
+            leafs.append(_unhex0x(buffered[index].commitment))
+            index += 1
+            if len(leafs) >= chunk:
+                yield leafs
+                leafs = []
+        if len(leafs) > 0:
+            yield leafs
+
+    def set_latest_block(self, block: int) -> bool:
+        with self.cond:
+            self.block = block if self.block is None else max(self.block, block)
+            self._notify()
+        return True
+
+    def add_deposit(self, event: EventDeposit) -> bool:
+        return self.add_deposits([event])
+
+    def add_withdraw(self, event: EventWithdraw) -> bool:
+        return self.add_withdraws([event])
+
+    def add_deposits(self, events: list[EventDeposit]) -> bool:
+        with self.cond:
+            for e in events:
+                self.deposits.setdefault(e.leaf_index, e)
+            self._notify()
+        return True
+
+    def add_withdraws(self, events: list[EventWithdraw]) -> bool:
+        with self.cond:
+            for e in events:
+                self.withdraws.setdefault(e.nullifier_hash, e)
+            self._notify()
+        return True
+
+    def commit(self, deposits: list[EventDeposit], withdraws: list[EventWithdraw], block: int) -> bool:
+        with self.cond:
+            for e in deposits:
+                self.deposits.setdefault(e.leaf_index, e)
+            for e in withdraws:
+                self.withdraws.setdefault(e.nullifier_hash, e)
+            self.block = block if self.block is None else max(self.block, block)
+        return self.flush()
+
+    '''
+    Write buffered events and the latest block to the wrapped client in one commit
+    @return True on succeed or nothing buffered
+            False if error occurred, events stay buffered for the next flush
+    '''
+    def flush(self) -> bool:
+        with self.flush_lock:
+            with self.cond:
+                if 0 == len(self.deposits) and 0 == len(self.withdraws) and self.block is None:
+                    return True
+                self.flushing  = (self.deposits, self.withdraws, self.block)
+                self.deposits  = {}
+                self.withdraws = {}
+                self.block     = None
+                self.time      = None
+            deposits, withdraws, block = self.flushing
+            if block is None:
+                block = self.client.get_latest_block()
+            succeed: bool = block is not None and self.client.commit(list(deposits.values()), list(withdraws.values()), block)
+            with self.cond:
+                if not succeed:
+                    # Put back in front of events arrived during the commit
+                    self.deposits  = deposits | self.deposits
+                    self.withdraws = withdraws | self.withdraws
+                    self.block     = self.flushing[2] if self.block is None else self.block
+                    self.time      = UnixTimestamp()
+                self.flushing  = ({}, {}, None)
+                self.flushed  += 1
+            return succeed
+
+    def _notify(self) -> None:
+        if self.time is None:
+            self.time = UnixTimestamp()
+        if len(self.deposits) + len(self.withdraws) >= self.max_events:
+            self.cond.notify_all()
+
+    def _loop(self) -> None:
+        while not self.off:
+            with self.cond:
+                size : int    = len(self.deposits) + len(self.withdraws)
+                delay: Second = Second(self.max_delay if self.time is None else self.time + self.max_delay - UnixTimestamp())
+                if size < self.max_events and delay > 0:
+                    self.cond.wait(delay)
+                    continue
+            if not self.flush():
+                # Wait before retry, events stay buffered
+                with self.cond:
+                    self.cond.wait(self.max_delay)
+
 
 class Factory(object):
 
+    '''
+    @param write_behind Buffer writes with WriteBehindClient
+    @param kwargs       Options of the backend client, e.g. readers and statement_cache of SQLiteClient, capacity of RecordClient
+    '''
     @staticmethod
-    def client(backend: Backend) -> InterfaceClient:
+    def client(backend: Backend, write_behind: bool = False, **kwargs) -> InterfaceClient:
         if backend == Backend.SQLITE:
-            return SQLiteClient()
+            client: InterfaceClient = SQLiteClient(**kwargs)
+        elif backend == Backend.RECORD:
+            client: InterfaceClient = RecordClient(**kwargs)
         else:
             raise NotImplementedError
+        return WriteBehindClient(client) if write_behind else client
+
+
+SNAPSHOT_MAGIC   : bytes         = b'TCSNAP01'
+SNAPSHOT_HEADER  : struct.Struct = struct.Struct('<8sQqqQQ32s')  # magic, block, latest leaf (-1 if none), unspent, deposits, withdraws, sha256
+SNAPSHOT_DEPOSIT : struct.Struct = struct.Struct('<QQQ32s32s')  # leaf index, timestamp, block, tx hash, commitment
+SNAPSHOT_WITHDRAW: struct.Struct = struct.Struct('<Q32s32s20s32s')  # block, tx hash, nullifier hash, to, fee
+
+
+'''
+Export events and Info up to a block into a zlib compressed snapshot file.
+Deposit records come in leaf index order, so they are also the leaf set of the Merkle tree.
+Checksum is sha256 of the header without checksum, followed by the compressed body.
+Written to path + '.tmp' and moved over path only after events read are checked against count_events()
+and deposits run from leaf 0 without a hole, so a crash or read error never leaves a partial snapshot
+nor destroys an existing one.
+@param  client  Opened database
+@param  path    Snapshot file, replaced on succeed
+@param  block   Up to which block number (inclusive), latest synced block if None
+@return True on succeed
+        False if error occurred
+'''
+def Export(client: InterfaceClient, path: str, block: int | None = None) -> bool:
+    TAG   : str        = 'Export'
+    latest: int | None = client.get_latest_block()
+    if latest is None:
+        return False
+    if block is None:
+        block = latest
+    elif block > latest:
+        Log.Error(TAG, f'Block {block} is not synced yet, latest: {latest}')
+        return False
+    counts: tuple[int, int] | None = client.count_events(block)
+    if counts is None:
+        return False
+
+    directory: str = os.path.dirname(path)
+    if directory != '' and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    temp: str = path + '.tmp'
+    try:
+        with open(temp, 'wb') as file:
+            file.write(bytes(SNAPSHOT_HEADER.size))  # Written at last
+            body      : hashlib._Hash  = hashlib.sha256()
+            compressor: zlib._Compress = zlib.compressobj(6)
+            def write(data: bytes) -> None:
+                data = compressor.compress(data)
+                body.update(data)
+                file.write(data)
+
+            leaf     : int = -1
+            deposits : int = 0
+            withdraws: int = 0
+            for events in client.iter_deposits(block):
+                write(b''.join(SNAPSHOT_DEPOSIT.pack(e.leaf_index, int(e.timestamp), e.blk_num, _unhex0x(e.tx_hash), _unhex0x(e.commitment)) for e in events))
+                leaf      = max(leaf, events[-1].leaf_index)
+                deposits += len(events)
+            for events in client.iter_withdraws(block):
+                write(b''.join(SNAPSHOT_WITHDRAW.pack(e.blk_num, _unhex0x(e.tx_hash), _unhex0x(e.nullifier_hash), _unhex0x(e.to), e.fee.to_bytes(32, 'big')) for e in events))
+                withdraws += len(events)
+            data: bytes = compressor.flush()
+            body.update(data)
+            file.write(data)
+            if (deposits, withdraws) != counts or deposits != leaf + 1:
+                Log.Error(TAG, f'Read {deposits}/{counts[0]} deposits up to leaf {leaf} and {withdraws}/{counts[1]} withdraws, snapshot not written')
+                return False
+
+            header  : bytes = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, block, leaf, deposits - withdraws, deposits, withdraws, bytes(32))
+            checksum: bytes = hashlib.sha256(header[:-32] + body.digest()).digest()
+            file.seek(0)
+            file.write(header[:-32] + checksum)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp, path)
+        Log.Info(TAG, f'Exported {deposits} deposits and {withdraws} withdraws up to block {block} to {path}')
+        return True
+    except Exception as e:
+        Log.Error(TAG, f'Export exception, error: {e}')
+        return False
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+'''
+Verify and bulk-load a snapshot of Export(), latest block is moved to the snapshot block with the last batch,
+so polling resumes from the next block and an interrupted import is simply run again.
+@param  client  Opened database, events already stored are ignored
+@param  path    Snapshot file
+@param  chunk   Number of events per commit
+@return True on succeed
+        False if error occurred or checksum mismatched
+'''
+def Import(client: InterfaceClient, path: str, chunk: int = 65536) -> bool:
+    TAG: str = 'Import'
+    try:
+        with open(path, 'rb') as file:
+            header: bytes = file.read(SNAPSHOT_HEADER.size)
+            if len(header) != SNAPSHOT_HEADER.size or not header.startswith(SNAPSHOT_MAGIC):
+                Log.Error(TAG, f'Not a snapshot file: {path}')
+                return False
+            _, block, leaf, unspent, deposits, withdraws, checksum = SNAPSHOT_HEADER.unpack(header)
+
+            # Verify before loading anything
+            body: hashlib._Hash = hashlib.sha256()
+            while data := file.read(1 << 20):
+                body.update(data)
+            if hashlib.sha256(header[:-32] + body.digest()).digest() != checksum:
+                Log.Error(TAG, f'Checksum mismatched: {path}')
+                return False
+
+            # Decompress stream, deposit records come before withdraw records
+            file.seek(SNAPSHOT_HEADER.size)
+            decompressor   : zlib._Decompress    = zlib.decompressobj()
+            pending        : bytes               = b''
+            loaded         : list[int]           = [0, 0]  # Deposits, withdraws
+            batch_deposits : list[EventDeposit]  = []
+            batch_withdraws: list[EventWithdraw] = []
+            eof            : bool                = False
+            while not eof:
+                data: bytes = file.read(1 << 20)
+                if len(data) > 0:
+                    pending += decompressor.decompress(data)
+                else:
+                    pending += decompressor.flush()
+                    eof      = True
+                offset: int = 0
+                while loaded[0] < deposits and len(pending) - offset >= SNAPSHOT_DEPOSIT.size:
+                    leaf_index, timestamp, blk_num, tx_hash, commitment = SNAPSHOT_DEPOSIT.unpack_from(pending, offset)
+                    batch_deposits.append(EventDeposit(timestamp, blk_num, tx_hash.hex(), commitment.hex(), leaf_index))
+                    offset    += SNAPSHOT_DEPOSIT.size
+                    loaded[0] += 1
+                while loaded[0] == deposits and loaded[1] < withdraws and len(pending) - offset >= SNAPSHOT_WITHDRAW.size:
+                    blk_num, tx_hash, nullifier_hash, to, fee = SNAPSHOT_WITHDRAW.unpack_from(pending, offset)
+                    batch_withdraws.append(EventWithdraw(blk_num, tx_hash.hex(), nullifier_hash.hex(), to.hex(), int.from_bytes(fee, 'big')))
+                    offset    += SNAPSHOT_WITHDRAW.size
+                    loaded[1] += 1
+                pending = pending[offset:]
+
+                # Latest block is not moved until everything is loaded
+                if len(batch_deposits) + len(batch_withdraws) >= chunk:
+                    if not client.commit(batch_deposits, batch_withdraws, 0):
+                        return False
+                    batch_deposits  = []
+                    batch_withdraws = []
+            if loaded != [deposits, withdraws] or len(pending) > 0:
+                Log.Error(TAG, f'Snapshot is truncated, loaded {loaded[0]}/{deposits} deposits and {loaded[1]}/{withdraws} withdraws')
+                return False
+            if not client.commit(batch_deposits, batch_withdraws, block):
+                return False
+
+        if client.get_latest_leaf() != leaf or client.get_unspent() != unspent:
+            Log.Warn(TAG, f'Database had other events, latest leaf: {client.get_latest_leaf()}, unspent: {client.get_unspent()}')
+        Log.Info(TAG, f'Imported {deposits} deposits and {withdraws} withdraws up to block {block} from {path}')
+        return True
+    except Exception as e:
+        Log.Error(TAG, f'Import exception, error: {e}')
+        return False
@@ -1,13 +1,21 @@
+import mmap
+import os
+from array import array
+import struct
 import threading as TR
 from cpphash import cpphash
 from enum import Enum
 from hexbytes import HexBytes
+from typing import Any
 
 import Log
 
 
 class ImplType(Enum):
-    MEMORY = 'memory'
+    MEMORY   = 'memory'
+    FRONTIER = 'frontier'
+    COMPACT  = 'compact'
+    MMAP     = 'mmap'
 
 
 class Interface(object):
@@ -19,6 +27,9 @@ class Interface(object):
     # Keccak256("tornado") % FILED_SIZE
     ZERO_VALUE: HexBytes = HexBytes.fromhex('2FE54C60D3ACABF3343A35B6EBA15DB4821B340F76E741E2249685ED4899AF6C')
 
+    # Number of recent roots a proof may refer to, same as the contract
+    ROOT_HISTORY_SIZE: int = 30
+
     def __init__(self, _type: ImplType) -> None:
         self._type: ImplType = _type
 
@@ -26,6 +37,17 @@ class Interface(object):
     def is_left(node_index: int) -> bool:
         return node_index % 2 == 0
 
+    '''
+    Get hashes of empty subtrees, same as zeros() of the contract
+    @return [ZERO_VALUE, H(ZERO_VALUE, ZERO_VALUE), ...], one per level, height + 1 in total
+    '''
+    @staticmethod
+    def zero_hashes(height: int) -> list[HexBytes]:
+        zeros: list[HexBytes] = [Interface.ZERO_VALUE]
+        for _ in range(0, height):
+            zeros.append(cpphash.poseidon([zeros[-1], zeros[-1]])[1])
+        return zeros
+
     def implementation(self) -> ImplType:
         return self._type
 
@@ -40,6 +62,12 @@ class Interface(object):
     def root(self) -> HexBytes | None:
         raise NotImplementedError
 
+    '''
+    Check if root is the current root or one of the last ROOT_HISTORY_SIZE roots
+    '''
+    def is_known_root(self, root: HexBytes) -> bool:
+        raise NotImplementedError
+
     '''
     Get leaf value by index
     @return None if index is out of range
@@ -49,10 +77,30 @@ class Interface(object):
 
     '''
     Get path to root from leaf
+    @param  root    Build path against a known recent root instead of the current one
     @return [(Leaf_L, Leaf_R), (Parent_L, Parent_R), ..., (Root, None)]
             None if HexBytes is exists
     '''
-    def path(self, leaf: HexBytes) -> list[tuple[HexBytes, HexBytes | None]] | None:
+    def path(self, leaf: HexBytes, root: HexBytes | None = None) -> list[tuple[HexBytes, HexBytes | None]] | None:
+        raise NotImplementedError
+
+    '''
+    Get path to root from leaf index, skip the leaf lookup
+    @param  root    Build path against a known recent root instead of the current one
+    @return Same as path()
+            None if index is out of range
+    '''
+    def path_by_index(self, index: int, root: HexBytes | None = None) -> list[tuple[HexBytes, HexBytes | None]] | None:
+        raise NotImplementedError
+
+    '''
+    Get paths of many leafs against the same root at once
+    @param  leaves  Leafs or leaf indexes, can be mixed
+    @param  root    Build paths against a known recent root instead of the current one
+    @return [path, ...] in the same order as leaves, each in the format of path(), or None if not found
+            None if root is unknown
+    '''
+    def paths(self, leaves: list[HexBytes | int], root: HexBytes | None = None) -> list[list[tuple[HexBytes, HexBytes | None]] | None] | None:
         raise NotImplementedError
 
     '''
@@ -63,63 +111,595 @@ class Interface(object):
     def add(self, leaf: HexBytes) -> bool:
         raise NotImplementedError
 
+    '''
+    Add a batch of leafs to the tree, same result as calling add() on each of them
+    @return True on succeed
+            False if any leaf value is out of range or tree capacity exceeded, nothing is added
+    '''
+    def add_many(self, leaves: list[HexBytes]) -> bool:
+        raise NotImplementedError
+
+
+class RootHistory(object):
+
+    '''
+    Ring of recent roots with a map for O(1) lookup, same as roots[] of the contract.
+    Each root carries an entry, e.g. Snapshot of the tree or tree size, which is returned by get().
+    '''
+    def __init__(self, capacity: int) -> None:
+        self.capacity: int                            = capacity
+        self.ring    : list[tuple[bytes, Any] | None] = [None] * capacity
+        self.head    : int                            = 0
+        self.known   : dict[bytes, Any]               = {}  # {root: entry}
+
+    def push(self, root: HexBytes, entry: Any) -> None:
+        evicted: tuple[bytes, Any] | None = self.ring[self.head]
+        if evicted is not None and self.known.get(evicted[0]) is evicted[1]:
+            del self.known[evicted[0]]
+        self.ring[self.head] = (bytes(root), entry)
+        self.known[bytes(root)] = entry
+        self.head = (self.head + 1) % self.capacity
+
+    def clear(self) -> None:
+        self.ring  = [None] * self.capacity
+        self.head  = 0
+        self.known = {}
+
+    '''
+    @return Entry pushed with root
+            None if root is unknown
+    '''
+    def get(self, root: HexBytes) -> Any | None:
+        return self.known.get(bytes(root))
+
+
+class Snapshot(object):
+
+    '''
+    Immutable view of a Memory tree when it had size leafs, reads take no lock.
+    Nodes left of the right-most one of each level belong to completely filled subtrees and never change,
+    so they are read from the live layers, the right-most ones are copied into frontier when published.
+    '''
+    def __init__(self, tree: 'Memory', size: int, frontier: list[HexBytes]) -> None:
+        self.tree    : Memory         = tree
+        self._size   : int            = size
+        self.frontier: list[HexBytes] = frontier  # Right-most node of each level, [leaf, parent, ..., root]
+
+    def size(self) -> int:
+        return self._size
+
+    def root(self) -> HexBytes | None:
+        return self.frontier[-1] if self._size > 0 else None
+
+    def leaf(self, index: int) -> HexBytes | None:
+        return self.tree.layers[0][index] if 0 <= index < self._size else None
+
+    def node(self, level: int, index: int) -> HexBytes:
+        if index << level >= self._size:
+            return self.tree.zeros[level]
+        if index == (self._size - 1) >> level:
+            return self.frontier[level]
+        return self.tree.layers[level][index]
+
+    def path(self, leaf: HexBytes) -> list[tuple[HexBytes, HexBytes | None]] | None:
+        # Check if tree empty
+        if 0 == self._size:
+            Log.Error(self.tree.TAG, f'Tree is empty')
+            return None
+
+        # Get leaf index of commitment
+        node_index: int | None = self.tree._find(leaf)
+        if node_index is None or node_index >= self._size:
+            Log.Error(self.tree.TAG, f'Leaf not found: {leaf.to_0x_hex()}')
+            return None
+
+        return self.path_by_index(node_index)
+
+    def path_by_index(self, index: int) -> list[tuple[HexBytes, HexBytes | None]] | None:
+        # Check if index in range
+        if not 0 <= index < self._size:
+            Log.Error(self.tree.TAG, f'Leaf index out of range: {index}')
+            return None
+
+        return self._path(index)
+
+    def _path(self, index: int) -> list[tuple[HexBytes, HexBytes | None]]:
+        node_index: int = index
+        path: list[tuple[HexBytes, HexBytes | None]] = []
+        for level in range(0, self.tree.height):
+            node_left: int = node_index - node_index % 2
+            path.append((self.node(level, node_left), self.node(level, node_left + 1)))
+            node_index //= 2
+        path.append((self.frontier[-1], None))
+        return path
+
+    '''
+    Paths of many leafs against this snapshot in one call, each node lookup is O(1) so nothing is cached between paths
+    '''
+    def paths(self, leaves: list[HexBytes | int]) -> list[list[tuple[HexBytes, HexBytes | None]] | None]:
+        result: list[list[tuple[HexBytes, HexBytes | None]] | None] = []
+        for leaf in leaves:
+            # Get leaf index of commitment
+            node_index: int | None = leaf if isinstance(leaf, int) else self.tree._find(leaf)
+            if node_index is None or not 0 <= node_index < self._size:
+                Log.Error(self.tree.TAG, f'Leaf not found: {leaf if isinstance(leaf, int) else leaf.to_0x_hex()}')
+                result.append(None)
+                continue
+
+            result.append(self._path(node_index))
+
+        return result
+
 
 class Memory(Interface):
 
-    def __init__(self, height: int) -> None:
-        super().__init__(ImplType.MEMORY)
+    '''
+    Writers hold mutex and publish a new Snapshot after each add, readers only use published snapshots.
+    '''
+    def __init__(self, height: int, _type: ImplType = ImplType.MEMORY) -> None:
+        super().__init__(_type)
         self.TAG     : str                  = __class__.__name__
         self.mutex   : TR.RLock             = TR.RLock()
         self.height  : int                  = height
-        self.layers  : list[list[HexBytes]] = [[] for _ in range(height + 1)]  # [[leafs], [parents], [root]]
+        self.layers  : list[list[HexBytes]] = [self._new_layer(level) for level in range(height + 1)]  # [[leafs], [parents], [root]]
+        self.indexes : dict[HexBytes, int]  = {}  # {leaf: leaf_index}
+        self.zeros   : list[HexBytes]       = Interface.zero_hashes(height)
+        self.history : RootHistory          = RootHistory(Interface.ROOT_HISTORY_SIZE)
+        self.version : Snapshot             = Snapshot(self, 0, [])
         self.capacity: int                  = 2 ** height
         self._size   : int                  = 0
 
+    '''
+    Create node storage of a level, any list-like supports len(), [index], [index] = node and append()
+    '''
+    def _new_layer(self, level: int) -> list[HexBytes]:
+        return []
+
+    '''
+    Remember leaf index of a new leaf, the first one wins for duplicated leafs
+    '''
+    def _index(self, leaf: HexBytes, index: int) -> None:
+        self.indexes.setdefault(leaf, index)
+
+    '''
+    Get leaf index of leaf
+    @return None if not found
+    '''
+    def _find(self, leaf: HexBytes) -> int | None:
+        return self.indexes.get(leaf)
+
+    '''
+    Get current snapshot, or snapshot of a known recent root
+    @return None if root is unknown
+    '''
+    def snapshot(self, root: HexBytes | None = None) -> Snapshot | None:
+        if root is None:
+            return self.version
+        return self.history.get(root)
+
     def size(self):
-        with self.mutex:
-            return self._size
+        return self.version.size()
 
     def root(self) -> HexBytes | None:
-        with self.mutex:
-            if 0 == self._size:
-                return None
-            return self.layers[-1][0]
+        return self.version.root()
 
     def leaf(self, index: int) -> HexBytes | None:
-        with self.mutex:
-            return self.layers[0][index] if 0 <= index < len(self.layers[0]) else None
+        return self.version.leaf(index)
 
-    def path(self, leaf: HexBytes) -> list[tuple[HexBytes, HexBytes | None]] | None:
+    def is_known_root(self, root: HexBytes) -> bool:
+        return self.history.get(root) is not None
+
+    def path(self, leaf: HexBytes, root: HexBytes | None = None) -> list[tuple[HexBytes, HexBytes | None]] | None:
+        snapshot: Snapshot | None = self.snapshot(root)
+        if snapshot is None:
+            Log.Error(self.TAG, f'Unknown root: {HexBytes(root).to_0x_hex()}')
+            return None
+        return snapshot.path(leaf)
+
+    def path_by_index(self, index: int, root: HexBytes | None = None) -> list[tuple[HexBytes, HexBytes | None]] | None:
+        snapshot: Snapshot | None = self.snapshot(root)
+        if snapshot is None:
+            Log.Error(self.TAG, f'Unknown root: {HexBytes(root).to_0x_hex()}')
+            return None
+        return snapshot.path_by_index(index)
+
+    def paths(self, leaves: list[HexBytes | int], root: HexBytes | None = None) -> list[list[tuple[HexBytes, HexBytes | None]] | None] | None:
+        snapshot: Snapshot | None = self.snapshot(root)
+        if snapshot is None:
+            Log.Error(self.TAG, f'Unknown root: {HexBytes(root).to_0x_hex()}')
+            return None
+        return snapshot.paths(leaves)
+
+    '''
+    Get node of the tree as it was when it had size leafs.
+    Subtrees completely filled before size never change and are read from layers, empty ones are zeros,
+    only the nodes on the right-most edge of size are re-hashed.
+    '''
+    def _node(self, level: int, index: int, size: int, cache: dict[tuple[int, int], HexBytes]) -> HexBytes:
+        if index << level >= size:
+            return self.zeros[level]
+        if (index + 1) << level <= size or size == self._size:
+            return self.layers[level][index]
+        node: HexBytes | None = cache.get((level, index))
+        if node is None:
+            node_left : HexBytes = self._node(level - 1, index * 2, size, cache)
+            node_right: HexBytes = self._node(level - 1, index * 2 + 1, size, cache)
+            node = cpphash.poseidon([node_left, node_right])[1]
+            cache[(level, index)] = node
+        return node
+
+    '''
+    Record snapshots of sizes (size_from, size_to] into history, only the last ROOT_HISTORY_SIZE of them matter,
+    then publish size_to, which must be the current size, as the current snapshot
+    '''
+    def _record_roots(self, size_from: int, size_to: int) -> None:
+        for size in range(max(size_from, size_to - Interface.ROOT_HISTORY_SIZE) + 1, size_to + 1):
+            cache   : dict[tuple[int, int], HexBytes] = {}
+            frontier: list[HexBytes] = [HexBytes(self._node(level, (size - 1) >> level, size, cache)) for level in range(0, self.height + 1)]
+            snapshot: Snapshot       = Snapshot(self, size, frontier)
+            self.history.push(frontier[-1], snapshot)
+            if size == self._size:
+                self.version = snapshot
+        if 0 == size_to:
+            self.version = Snapshot(self, 0, [])
+
+    def add(self, leaf: HexBytes) -> bool:
         with self.mutex:
-            # Check if tree empty
-            if 0 == len(self.layers[0]):
-                Log.Error(self.TAG, f'Tree is empty')
-                return None
+            # Check if legal
+            if int.from_bytes(leaf, byteorder='big') >= int.from_bytes(Interface.FILED_SIZE, byteorder='big'):
+                Log.Error(self.TAG, f'Leaf value out of range: {leaf.to_0x_hex()}')
+                return False
+            elif len(self.layers[0]) >= self.capacity:
+                Log.Error(self.TAG, f'Tree is full')
+                return False
 
-            # Get leaf index of commitment
-            node_index: int = -1
-            for i in range(0, len(self.layers[0])):
-                if self.layers[0][i] == leaf:
-                    node_index = i
-                    break
-            if node_index == -1:
-                Log.Error(self.TAG, f'Leaf not found: {leaf.to_0x_hex()}')
-                return None
-
-            # Build path
-            path: list[tuple[HexBytes, HexBytes | None]] = []
+            # Append leaf
+            self.layers[0].append(leaf)
+            node_index: int = len(self.layers[0]) - 1
+            self._index(leaf, node_index)
+
+            # Re-build merkle tree, update or append the parent on each level
             for level in range(0, self.height):
                 if Interface.is_left(node_index):
                     node_left : HexBytes = self.layers[level][node_index]
-                    node_right: HexBytes = self.layers[level][node_index + 1] if node_index + 1 < len(self.layers[level]) else Interface.ZERO_VALUE
+                    node_right: HexBytes = self.layers[level][node_index + 1] if node_index + 1 < len(self.layers[level]) else self.zeros[level]
                 else:
                     node_left : HexBytes = self.layers[level][node_index - 1]
                     node_right: HexBytes = self.layers[level][node_index]
-                path.append((node_left, node_right))
+                parent: HexBytes = cpphash.poseidon([node_left, node_right])[1]
                 node_index //= 2
-            path.append((self.layers[self.height][0], None))
+                if node_index == len(self.layers[level + 1]):
+                    self.layers[level + 1].append(parent)
+                else:
+                    self.layers[level + 1][node_index] = parent
 
-            return path
+            self._size += 1
+            self._record_roots(self._size - 1, self._size)
+            return True
+
+    def add_many(self, leaves: list[HexBytes]) -> bool:
+        with self.mutex:
+            # Check if legal
+            for leaf in leaves:
+                if int.from_bytes(leaf, byteorder='big') >= int.from_bytes(Interface.FILED_SIZE, byteorder='big'):
+                    Log.Error(self.TAG, f'Leaf value out of range: {leaf.to_0x_hex()}')
+                    return False
+            if len(self.layers[0]) + len(leaves) > self.capacity:
+                Log.Error(self.TAG, f'Tree is full')
+                return False
+            if 0 == len(leaves):
+                return True
+
+            # Append leafs
+            node_index: int = len(self.layers[0])
+            for leaf in leaves:
+                self._index(leaf, len(self.layers[0]))
+                self.layers[0].append(leaf)
+
+            # Re-build merkle tree, each level once from the first dirty pair to the end
+            for level in range(0, self.height):
+                nodes: list[HexBytes] = self.layers[level]
+                first: int            = node_index - node_index % 2
+                pairs: list[tuple[HexBytes, HexBytes]] = [
+                    (nodes[i], nodes[i + 1] if i + 1 < len(nodes) else self.zeros[level])
+                    for i in range(first, len(nodes), 2)
+                ]
+                node_index = first // 2
+                for i, parent in enumerate(cpphash.poseidon_many(pairs), start=node_index):
+                    if i == len(self.layers[level + 1]):
+                        self.layers[level + 1].append(parent)
+                    else:
+                        self.layers[level + 1][i] = parent
+
+            self._size += len(leaves)
+            self._record_roots(self._size - len(leaves), self._size)
+            return True
+
+
+class NodeLayer(object):
+
+    NODE_SIZE: int = 32
+
+    '''
+    Nodes of a level in fixed 32-byte slots of one contiguous buffer.
+    Buffer is reserved for the full level up front and never resized, so handed out memoryviews stay valid,
+    anonymous mapping only commits pages that have been written.
+    @param buffer   Use a slice of an existing mapping instead, at least capacity * NODE_SIZE bytes
+    @param length   Number of nodes already in the buffer
+    '''
+    def __init__(self, capacity: int, buffer: memoryview | None = None, length: int = 0) -> None:
+        self.capacity: int        = capacity
+        self.length  : int        = length
+        self.view    : memoryview = memoryview(mmap.mmap(-1, capacity * NodeLayer.NODE_SIZE)) if buffer is None else buffer
+        self.readonly: memoryview = self.view.toreadonly()
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index: int) -> memoryview:
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(f'Node index out of range: {index}')
+        offset: int = index * NodeLayer.NODE_SIZE
+        return self.readonly[offset:offset + NodeLayer.NODE_SIZE]
+
+    def __setitem__(self, index: int, node: bytes | memoryview) -> None:
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(f'Node index out of range: {index}')
+        if len(node) != NodeLayer.NODE_SIZE:
+            node = bytes(node).rjust(NodeLayer.NODE_SIZE, b'\x00')
+        offset: int = index * NodeLayer.NODE_SIZE
+        self.view[offset:offset + NodeLayer.NODE_SIZE] = node
+
+    def append(self, node: bytes | memoryview) -> None:
+        if self.length >= self.capacity:
+            raise IndexError(f'Layer is full')
+        self.length += 1
+        self[self.length - 1] = node
+
+
+class LeafIndex(object):
+
+    '''
+    Leaf -> first leaf index, an open-addressing hash table of uint32 slots kept at most half full.
+    Leafs are compared in the leaf layer instead of being copied, so it takes 8 bytes or less per leaf.
+    @param layer    Leaf layer the indexes point into
+    '''
+    def __init__(self, layer: NodeLayer) -> None:
+        self.layer: NodeLayer = layer
+        self.slots: array     = array('I', bytes(4 * 1024))  # Leaf index + 1, 0 if empty
+        self.count: int       = 0
+
+    '''
+    @return Slot of leaf, or the empty slot to put it in, and leaf index if found
+    '''
+    def _probe(self, leaf: bytes) -> tuple[int, int | None]:
+        mask: int = len(self.slots) - 1
+        slot: int = int.from_bytes(leaf[24:], byteorder='big') & mask  # Low bytes of field elements are uniform
+        while True:
+            entry: int = self.slots[slot]
+            if 0 == entry:
+                return slot, None
+            if self.layer[entry - 1] == leaf:
+                return slot, entry - 1
+            slot = (slot + 1) & mask
+
+    def add(self, leaf: bytes, index: int) -> None:
+        slot, found = self._probe(leaf)
+        if found is not None:
+            return
+        self.slots[slot] = index + 1
+        self.count += 1
+        if self.count * 2 > len(self.slots):
+            self._grow()
+
+    def find(self, leaf: bytes) -> int | None:
+        return self._probe(bytes(leaf).rjust(NodeLayer.NODE_SIZE, b'\x00'))[1]
+
+    def _grow(self) -> None:
+        entries: array = self.slots
+        self.slots = array('I', bytes(len(entries) * 8))
+        mask: int = len(self.slots) - 1
+        for entry in entries:
+            if 0 == entry:
+                continue
+            slot: int = int.from_bytes(self.layer[entry - 1][24:], byteorder='big') & mask
+            while 0 != self.slots[slot]:
+                slot = (slot + 1) & mask
+            self.slots[slot] = entry
+
+
+class Compact(Memory):
+
+    '''
+    Same as Memory, but nodes are stored in NodeLayer instead of a list of HexBytes,
+    leaf(), root() and path() return memoryview slices of the layer buffers.
+    Leafs are indexed in a LeafIndex on first path() by leaf instead of a dict of every leaf.
+    '''
+    def __init__(self, height: int, _type: ImplType = ImplType.COMPACT) -> None:
+        super().__init__(height, _type)
+        self.TAG        : str       = __class__.__name__
+        self.index_mutex: TR.Lock   = TR.Lock()
+        self.leaf_index : LeafIndex = LeafIndex(self.layers[0])
+        self.indexed    : int       = 0  # Leafs before it are in self.leaf_index
+
+    def _new_layer(self, level: int) -> NodeLayer:
+        return NodeLayer(2 ** (self.height - level))
+
+    def _index(self, leaf: HexBytes, index: int) -> None:
+        pass
+
+    def _find(self, leaf: HexBytes) -> int | None:
+        # Index leafs added since last lookup
+        with self.index_mutex:
+            size: int = self.version.size()
+            for i in range(self.indexed, size):
+                self.leaf_index.add(self.layers[0][i], i)
+            self.indexed = max(self.indexed, size)
+            return self.leaf_index.find(leaf)
+
+
+class Mapped(Compact):
+
+    MAGIC      : bytes         = b'TCMTREE1'
+    HEADER     : struct.Struct = struct.Struct('<8sIQ')  # magic, height, size
+    HEADER_SIZE: int           = 32
+
+    '''
+    Same as Compact, but layers live in a memory-mapped file which is reopened as is on restart.
+    File layout: header, then every level from leafs to root, each reserved for its full capacity.
+    Leaf lookup index of path() is rebuilt lazily on first use, so opening does not depend on tree size.
+    @param path         File path, e.g. next to the database
+    @param latest_leaf  Database.get_latest_leaf(), tree is rolled back if it is ahead of the database,
+                        -1 if no deposit, e.g. the database was reset, rolls the tree back to no leaf,
+                        None to skip the check when the database failed to read
+    '''
+    def __init__(self, height: int, path: str, latest_leaf: int | None = None) -> None:
+        self.TAG        : str        = __class__.__name__
+        self.file       : str        = path
+        self.buffer     : mmap.mmap  = self._map(path, height)
+        self.view       : memoryview = memoryview(self.buffer)
+        super().__init__(height, ImplType.MMAP)
+        self.TAG = __class__.__name__
+
+        # Restore size from header
+        size: int = Mapped.HEADER.unpack_from(self.buffer, 0)[2]
+        for level in range(0, self.height + 1):
+            self.layers[level].length = (size + 2 ** level - 1) >> level
+        self._size = size
+        self._record_roots(0, size)
+
+        # Check consistency with database
+        if latest_leaf is None:
+            Log.Warn(self.TAG, f'Latest leaf of database unknown, keep {self._size} leafs without check')
+            return
+        expect: int = latest_leaf + 1
+        if self._size > expect:
+            Log.Warn(self.TAG, f'Tree is ahead of database, roll back from {self._size} to {expect} leafs')
+            self._truncate(expect)
+        elif self._size < expect:
+            Log.Info(self.TAG, f'Tree is behind database, {expect - self._size} leafs to add')
+
+    def _map(self, path: str, height: int) -> mmap.mmap:
+        directory: str = os.path.dirname(path)
+        if directory != '' and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        length: int = Mapped.HEADER_SIZE + (2 ** (height + 1) - 1) * NodeLayer.NODE_SIZE
+        fd    : int = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            header: bytes = os.pread(fd, Mapped.HEADER.size, 0)
+            if len(header) == Mapped.HEADER.size:
+                magic, height_, _ = Mapped.HEADER.unpack(header)
+                if magic != Mapped.MAGIC or height_ != height or os.fstat(fd).st_size != length:
+                    Log.Warn(self.TAG, f'Incompatible tree file, recreate: {path}')
+                    os.ftruncate(fd, 0)
+                    header = b''
+            if len(header) != Mapped.HEADER.size:
+                os.ftruncate(fd, length)  # Sparse, blocks are allocated when written
+                os.pwrite(fd, Mapped.HEADER.pack(Mapped.MAGIC, height, 0), 0)
+            return mmap.mmap(fd, length)
+        finally:
+            os.close(fd)
+
+    def _new_layer(self, level: int) -> NodeLayer:
+        capacity: int = 2 ** (self.height - level)
+        offset  : int = Mapped.HEADER_SIZE + (2 ** (self.height + 1) - 2 ** (self.height - level + 1)) * NodeLayer.NODE_SIZE
+        return NodeLayer(capacity, self.view[offset:offset + capacity * NodeLayer.NODE_SIZE])
+
+    def _write_header(self) -> None:
+        Mapped.HEADER.pack_into(self.buffer, 0, Mapped.MAGIC, self.height, self._size)
+
+    '''
+    Drop leafs after size and re-hash the right-most node of each level
+    '''
+    def _truncate(self, size: int) -> None:
+        with self.mutex:
+            for level in range(0, self.height + 1):
+                self.layers[level].length = (size + 2 ** level - 1) >> level
+            if size > 0:
+                for level in range(1, self.height + 1):
+                    child     : int      = (len(self.layers[level]) - 1) * 2
+                    node_left : HexBytes = self.layers[level - 1][child]
+                    node_right: HexBytes = self.layers[level - 1][child + 1] if child + 1 < len(self.layers[level - 1]) else self.zeros[level - 1]
+                    self.layers[level][len(self.layers[level]) - 1] = cpphash.poseidon([node_left, node_right])[1]
+            with self.index_mutex:
+                self.leaf_index = LeafIndex(self.layers[0])
+                self.indexed    = 0
+            self._size = size
+            self._write_header()
+            self.history.clear()
+            self._record_roots(0, size)
+
+    def add(self, leaf: HexBytes) -> bool:
+        with self.mutex:
+            if not super().add(leaf):
+                return False
+            self._write_header()
+            return True
+
+    def add_many(self, leaves: list[HexBytes]) -> bool:
+        with self.mutex:
+            if not super().add_many(leaves):
+                return False
+            self._write_header()
+            return True
+
+    '''
+    Flush dirty pages to the file
+    '''
+    def flush(self) -> None:
+        with self.mutex:
+            self.buffer.flush()
+
+
+class Frontier(Interface):
+
+    '''
+    Append-only tree keeps only the right-most filled subtree of each level, same as the contract.
+    Tracks root in O(height) memory, leafs and paths are not available.
+    '''
+    def __init__(self, height: int) -> None:
+        super().__init__(ImplType.FRONTIER)
+        self.TAG     : str             = __class__.__name__
+        self.mutex   : TR.RLock        = TR.RLock()
+        self.height  : int             = height
+        self.zeros   : list[HexBytes]  = Interface.zero_hashes(height)
+        self.filled  : list[HexBytes]  = self.zeros[:height]  # Filled subtrees, one per level
+        self.history : RootHistory     = RootHistory(Interface.ROOT_HISTORY_SIZE)
+        self.capacity: int             = 2 ** height
+        self._size   : int             = 0
+        self._root   : HexBytes | None = None
+
+    def size(self):
+        with self.mutex:
+            return self._size
+
+    def root(self) -> HexBytes | None:
+        with self.mutex:
+            return self._root
+
+    def is_known_root(self, root: HexBytes) -> bool:
+        with self.mutex:
+            return self.history.get(root) is not None
+
+    def leaf(self, index: int) -> HexBytes | None:
+        Log.Error(self.TAG, f'Leaf not available in frontier tree')
+        return None
+
+    def path(self, leaf: HexBytes, root: HexBytes | None = None) -> list[tuple[HexBytes, HexBytes | None]] | None:
+        Log.Error(self.TAG, f'Path not available in frontier tree')
+        return None
+
+    def path_by_index(self, index: int, root: HexBytes | None = None) -> list[tuple[HexBytes, HexBytes | None]] | None:
+        Log.Error(self.TAG, f'Path not available in frontier tree')
+        return None
+
+    def paths(self, leaves: list[HexBytes | int], root: HexBytes | None = None) -> list[list[tuple[HexBytes, HexBytes | None]] | None] | None:
+        Log.Error(self.TAG, f'Path not available in frontier tree')
+        return None
 
     def add(self, leaf: HexBytes) -> bool:
         with self.mutex:
@@ -127,48 +707,54 @@ class Memory(Interface):
             if int.from_bytes(leaf, byteorder='big') >= int.from_bytes(Interface.FILED_SIZE, byteorder='big'):
                 Log.Error(self.TAG, f'Leaf value out of range: {leaf.to_0x_hex()}')
                 return False
-            elif len(self.layers[0]) >= self.capacity:
+            elif self._size >= self.capacity:
                 Log.Error(self.TAG, f'Tree is full')
                 return False
 
-            # Prepare left leaf, right leaf and their parent
-            self.layers[0].append(leaf)
-            node_index: int = len(self.layers[0]) - 1
-            if Interface.is_left(node_index):
-                add_parent: bool     = True
-                node_left : HexBytes = leaf
-                node_right: HexBytes = Interface.ZERO_VALUE
-            else:
-                add_parent: bool     = False
-                node_left : HexBytes = self.leaf(node_index - 1)
-                node_right: HexBytes = leaf
-            parent: HexBytes = cpphash.poseidon([node_left, node_right])[1]
-
-            # Re-build merkle tree
-            for i in range(1, self.height):
-                node_index += 1 if 0 == node_index % 2 else 0
-                node_index //= 2
-                if add_parent:
-                    self.layers[i].append(parent)
-                else:
-                    self.layers[i][node_index] = parent
+            # Hash up with filled subtree on the left or empty subtree on the right
+            node_index: int      = self._size
+            node      : HexBytes = leaf
+            for level in range(0, self.height):
                 if Interface.is_left(node_index):
-                    add_parent = True
-                    node_left  = self.layers[i][node_index]
-                    node_right = Interface.ZERO_VALUE
+                    self.filled[level] = node
+                    node = cpphash.poseidon([node, self.zeros[level]])[1]
                 else:
-                    add_parent = False
-                    node_left  = self.layers[i][node_index - 1]
-                    node_right = self.layers[i][node_index]
-                parent = cpphash.poseidon([node_left, node_right])[1]
-            self.layers[self.height][0] = parent
+                    node = cpphash.poseidon([self.filled[level], node])[1]
+                node_index //= 2
+            self._root = node
 
             self._size += 1
+            self.history.push(node, self._size)
+            return True
+
+    def add_many(self, leaves: list[HexBytes]) -> bool:
+        with self.mutex:
+            # Check if legal
+            for leaf in leaves:
+                if int.from_bytes(leaf, byteorder='big') >= int.from_bytes(Interface.FILED_SIZE, byteorder='big'):
+                    Log.Error(self.TAG, f'Leaf value out of range: {leaf.to_0x_hex()}')
+                    return False
+            if self._size + len(leaves) > self.capacity:
+                Log.Error(self.TAG, f'Tree is full')
+                return False
+
+            for leaf in leaves:
+                self.add(leaf)
             return True
 
 
-def Create(impl: ImplType, height: int) -> Interface:
+'''
+@param path         Tree file of ImplType.MMAP
+@param latest_leaf  Latest leaf index in database of ImplType.MMAP, -1 if no deposit, None to skip the check
+'''
+def Create(impl: ImplType, height: int, path: str = '', latest_leaf: int | None = None) -> Interface:
     if impl == ImplType.MEMORY:
         return Memory(height)
+    elif impl == ImplType.FRONTIER:
+        return Frontier(height)
+    elif impl == ImplType.COMPACT:
+        return Compact(height)
+    elif impl == ImplType.MMAP:
+        return Mapped(height, path, latest_leaf)
     else:
         raise NotImplementedError
@@ -1,9 +1,9 @@
 from enum import Enum
-from typing import NewType
+from typing import Callable, NewType
 
 from hexbytes import HexBytes
 from web3 import Web3
-from web3.types import Wei
+from web3.types import LogReceipt, Wei
 
 
 Second      = NewType("Second", float)
@@ -18,9 +18,18 @@ class ChainID(Enum):
 
 class LogEvent(object):
 
+    __slots__ = ('signature',)
+
     def __init__(self, signature: str) -> None:
         self.signature: str = signature
 
+    '''
+    Decode a log of this event, see RegisterEvent()
+    '''
+    @staticmethod
+    def decode(log: LogReceipt) -> 'LogEvent':
+        raise NotImplementedError
+
     def __str__(self) -> str:
         raise NotImplementedError
 
@@ -30,12 +39,17 @@ class LogEvent(object):
 
 class EventDeposit(LogEvent):
 
+    __slots__ = ('timestamp', 'blk_num', 'tx_hash', 'commitment', 'leaf_index')
+
+    SIGNATURE: str      = 'Deposit(bytes32,uint32,uint256)'
+    TOPIC    : HexBytes = Web3.keccak(text=SIGNATURE)
+
     def __init__(self, timestamp : Second,
                        blk_num   : int,
                        tx_hash   : str,
                        commitment: str,
                        leaf_index: int) -> None:
-        super().__init__('Deposit(bytes32,uint32,uint256)')
+        super().__init__(EventDeposit.SIGNATURE)
         self.timestamp : Second = timestamp
         self.blk_num   : int    = blk_num
         self.tx_hash   : str    = '0x' + tx_hash if not tx_hash.startswith('0x') else tx_hash
@@ -44,7 +58,17 @@ class EventDeposit(LogEvent):
 
     @staticmethod
     def event_hash() -> HexBytes:
-        return Web3.keccak(text='Deposit(bytes32,uint32,uint256)')
+        return EventDeposit.TOPIC
+
+    @staticmethod
+    def decode(log: LogReceipt) -> 'EventDeposit':
+        data: HexBytes = log['data']
+        return EventDeposit(
+            int.from_bytes(data[:32], byteorder='big'),
+            log['blockNumber'],
+            log['transactionHash'].to_0x_hex(),
+            log['topics'][1].to_0x_hex(),
+            int.from_bytes(data[32:], byteorder='big'))
 
     @staticmethod
     def from_dict(_dict: dict) -> 'EventDeposit':
@@ -74,12 +98,17 @@ class EventDeposit(LogEvent):
 
 class EventWithdraw(LogEvent):
 
+    __slots__ = ('blk_num', 'tx_hash', 'nullifier_hash', 'to', 'fee')
+
+    SIGNATURE: str      = 'Withdrawal(address,bytes32,address,uint256)'
+    TOPIC    : HexBytes = Web3.keccak(text=SIGNATURE)
+
     def __init__(self, blk_num       : int,
                        tx_hash       : str,
                        nullifier_hash: str,
                        to            : str,
                        fee           : Wei) -> None:
-        super().__init__('Withdrawal(address,bytes32,address,uint256)')
+        super().__init__(EventWithdraw.SIGNATURE)
         self.blk_num       : int = blk_num
         self.tx_hash       : str = '0x' + tx_hash if not tx_hash.startswith('0x') else tx_hash
         self.nullifier_hash: str = '0x' + nullifier_hash if not nullifier_hash.startswith('0x') else nullifier_hash
@@ -88,7 +117,17 @@ class EventWithdraw(LogEvent):
 
     @staticmethod
     def event_hash() -> HexBytes:
-        return Web3.keccak(text='Withdrawal(address,bytes32,address,uint256)')
+        return EventWithdraw.TOPIC
+
+    @staticmethod
+    def decode(log: LogReceipt) -> 'EventWithdraw':
+        data: HexBytes = log['data']
+        return EventWithdraw(
+            log['blockNumber'],
+            log['transactionHash'].to_0x_hex(),
+            data[32:64].to_0x_hex(),
+            data[12:32].to_0x_hex(),
+            Wei(int.from_bytes(data[64:], byteorder='big')))
 
     @staticmethod
     def from_dict(_dict: dict) -> 'EventWithdraw':
@@ -114,3 +153,42 @@ class EventWithdraw(LogEvent):
             'to'            : self.to,
             'fee'           : self.fee,
         }
+
+
+# Topic0 -> decoder of the event, filled at import by RegisterEvent()
+DECODERS: dict[bytes, Callable[[LogReceipt], LogEvent]] = {}
+
+
+'''
+Register decoder of an event by its topic0, new event types are plugged in without touching the poll loop
+@param topic    Keccak of the event signature
+@param decoder  Turns a log into an event, e.g. decode() of a LogEvent subclass
+'''
+def RegisterEvent(topic: bytes, decoder: Callable[[LogReceipt], LogEvent]) -> None:
+    DECODERS[bytes(topic)] = decoder
+
+
+'''
+Decode a log by its topic0
+@return Event, None if the event is not registered
+'''
+def DecodeLog(log: LogReceipt) -> LogEvent | None:
+    decoder: Callable[[LogReceipt], LogEvent] | None = DECODERS.get(log['topics'][0]) if len(log['topics']) > 0 else None
+    return None if decoder is None else decoder(log)
+
+
+'''
+Decode a get_logs response in one pass
+@return Events in order of logs, None for logs of unregistered events
+'''
+def DecodeLogs(logs: list[LogReceipt]) -> list[LogEvent | None]:
+    decoders: dict[bytes, Callable[[LogReceipt], LogEvent]] = DECODERS
+    events  : list[LogEvent | None]                         = []
+    for log in logs:
+        decoder: Callable[[LogReceipt], LogEvent] | None = decoders.get(log['topics'][0]) if len(log['topics']) > 0 else None
+        events.append(None if decoder is None else decoder(log))
+    return events
+
+
+RegisterEvent(EventDeposit.TOPIC, EventDeposit.decode)
+RegisterEvent(EventWithdraw.TOPIC, EventWithdraw.decode)
@@ -32,3 +32,23 @@ def Sleep(interval: Second, cond: TR.Condition | None = None, interruptable: boo
             except KeyboardInterrupt:
                 if interruptable:
                     break
+
+
+class RateLimiter(object):
+
+    '''
+    Space calls of acquire() evenly to at most rate per second, across threads
+    @param rate Calls per second, not limited if 0
+    '''
+    def __init__(self, rate: float) -> None:
+        self.interval: Second  = Second(1.0 / rate if rate > 0 else 0)
+        self.mutex   : TR.Lock = TR.Lock()
+        self.next    : Second  = Second(0)  # Time point of next allowed call
+
+    def acquire(self) -> None:
+        with self.mutex:
+            now       : Second = UnixTimestamp()
+            time_point: Second = Second(max(now, self.next))
+            self.next = Second(time_point + self.interval)
+        if time_point > now:
+            time.sleep(time_point - now)
@@ -1,5 +1,16 @@
 from Types import Second
 
 
-RPC_QUERY_INTERVAL: Second = Second(0.5)
-RPC_RETRY_INTERVAL: Second = Second(1)
+RPC_QUERY_INTERVAL   : Second = Second(0.5)
+RPC_RETRY_INTERVAL   : Second = Second(1)
+RPC_BACKFILL_WORKERS : int    = 4
+RPC_BACKFILL_RATE    : float  = 10  # Requests per second
+RPC_CHUNK_SIZE       : int    = 1000  # Blocks per get_logs request to start with
+RPC_CHUNK_MAX        : int    = 100000
+RPC_CHUNK_LOGS       : int    = 5000  # Shrink chunk if a response has more logs
+RPC_CHUNK_LATENCY    : Second = Second(3)  # Shrink chunk if a response is slower
+RPC_HEDGE_DELAY      : Second = Second(2)  # Duplicate a request to another endpoint if no answer by then
+RPC_SUBSCRIBE_TIMEOUT: Second = Second(60)  # Fall back to polling if no new head for this long
+DB_FLUSH_EVENTS      : int    = 10000
+DB_FLUSH_INTERVAL    : Second = Second(5)
+DB_CLOSE_TIMEOUT     : Second = Second(5)  # Close read connections not returned by then, e.g. held by an abandoned iterator
@@ -1,21 +1,428 @@
+import os
 from hexbytes import HexBytes
 
 
+# BN254 scalar field, same as MerkleTree.Interface.FILED_SIZE
+FIELD_SIZE: int = 21888242871839275222246405745257275088548364400416034343698204186575808495617
+
+
+class PoseidonParams(object):
+
+    FULL_ROUNDS   : int       = 8
+    PARTIAL_ROUNDS: list[int] = [56, 57, 56, 60, 60, 63, 64, 63, 60, 66, 60, 65, 70, 60, 64, 68]  # By width 2..17
+
+    '''
+    Round constants and MDS matrix of width t (number of inputs + 1), same as poseidon_constants of circomlib.
+    Generated with the Grain LFSR of the reference implementation (generate_parameters_grain.sage),
+    field = 1 (prime), s-box = 0 (x^5), n = 254 bits.
+    '''
+    def __init__(self, t: int) -> None:
+        self.t             : int                   = t
+        self.partial_rounds: int                   = PoseidonParams.PARTIAL_ROUNDS[t - 2]
+        self.constants     : list[tuple[int, ...]] = []  # One tuple of t constants per round
+        self.mds           : list[tuple[int, ...]] = []  # t rows of t
+
+        # Initialize LFSR and discard the first 160 bits
+        state: list[int] = [0, 1, 0, 0, 0, 0]
+        for value, width in [(254, 12), (t, 12), (PoseidonParams.FULL_ROUNDS, 10), (self.partial_rounds, 10)]:
+            state += [int(bit) for bit in format(value, f'0{width}b')]
+        state += [1] * 30
+        def lfsr() -> int:
+            bit: int = state[62] ^ state[51] ^ state[38] ^ state[23] ^ state[13] ^ state[0]
+            state.pop(0)
+            state.append(bit)
+            return bit
+        for _ in range(0, 160):
+            lfsr()
+
+        # Output the second bit of each pair whose first bit is 1
+        def random_bits(n: int) -> int:
+            value: int = 0
+            while n > 0:
+                if lfsr() == 1:
+                    value = (value << 1) | lfsr()
+                    n -= 1
+                else:
+                    lfsr()
+            return value
+
+        # Round constants, rejection sampled into the field
+        constants: list[int] = []
+        while len(constants) < (PoseidonParams.FULL_ROUNDS + self.partial_rounds) * t:
+            value: int = random_bits(254)
+            if value < FIELD_SIZE:
+                constants.append(value)
+        self.constants = [tuple(constants[i:i + t]) for i in range(0, len(constants), t)]
+
+        # Cauchy matrix M[i][j] = 1 / (x[i] + y[j])
+        xs: list[int] = [random_bits(254) % FIELD_SIZE for _ in range(0, t)]
+        ys: list[int] = [random_bits(254) % FIELD_SIZE for _ in range(0, t)]
+        self.mds = [tuple(pow(x + y, FIELD_SIZE - 2, FIELD_SIZE) for y in ys) for x in xs]
+
+    '''
+    Poseidon permutation of [0, *inputs]
+    @return First element of the state
+    '''
+    def permute(self, inputs: list[int]) -> int:
+        p          : int                   = FIELD_SIZE
+        mds        : list[tuple[int, ...]] = self.mds
+        full_rounds: int                   = PoseidonParams.FULL_ROUNDS // 2
+        partial_end: int                   = full_rounds + self.partial_rounds
+        state      : list[int]             = [0] + inputs
+        for r, constants in enumerate(self.constants):
+            if r < full_rounds or r >= partial_end:
+                state = [pow(x + c, 5, p) for x, c in zip(state, constants)]
+            else:
+                state = [x + c for x, c in zip(state, constants)]
+                state[0] = pow(state[0], 5, p)
+            state = [sum(m * x for m, x in zip(row, state)) % p for row in mds]
+        return state[0]
+
+    '''
+    Same as permute([left, right]) of width 3, unrolled for merkle tree nodes
+    '''
+    def permute_pair(self, left: int, right: int) -> int:
+        p          : int = FIELD_SIZE
+        full_rounds: int = PoseidonParams.FULL_ROUNDS // 2
+        partial_end: int = full_rounds + self.partial_rounds
+        (m00, m01, m02), (m10, m11, m12), (m20, m21, m22) = self.mds
+        s0, s1, s2 = 0, left, right
+        for r, (c0, c1, c2) in enumerate(self.constants):
+            if r < full_rounds or r >= partial_end:
+                s0, s1, s2 = pow(s0 + c0, 5, p), pow(s1 + c1, 5, p), pow(s2 + c2, 5, p)
+            else:
+                s0, s1, s2 = pow(s0 + c0, 5, p), s1 + c1, s2 + c2
+            s0, s1, s2 = (m00 * s0 + m01 * s1 + m02 * s2) % p, (m10 * s0 + m11 * s1 + m12 * s2) % p, (m20 * s0 + m21 * s1 + m22 * s2) % p
+        return s0
+
+
+class Blake256(object):
+
+    IV   : list[int]       = [0x6A09E667, 0xBB67AE85, 0x3C6EF372, 0xA54FF53A, 0x510E527F, 0x9B05688C, 0x1F83D9AB, 0x5BE0CD19]
+    C    : list[int]       = [0x243F6A88, 0x85A308D3, 0x13198A2E, 0x03707344, 0xA4093822, 0x299F31D0, 0x082EFA98, 0xEC4E6C89,
+                              0x452821E6, 0x38D01377, 0xBE5466CF, 0x34E90C6C, 0xC0AC29B7, 0xC97C50DD, 0x3F84D5B5, 0xB5470917]
+    SIGMA: list[list[int]] = [
+        [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15],
+        [14, 10, 4, 8, 9, 15, 13, 6, 1, 12, 0, 2, 11, 7, 5, 3],
+        [11, 8, 12, 0, 5, 2, 15, 13, 10, 14, 3, 6, 7, 1, 9, 4],
+        [7, 9, 3, 1, 13, 12, 11, 14, 2, 6, 5, 10, 4, 0, 15, 8],
+        [9, 0, 5, 7, 2, 4, 10, 15, 14, 1, 11, 12, 6, 8, 3, 13],
+        [2, 12, 6, 10, 0, 11, 8, 3, 4, 13, 7, 5, 15, 14, 1, 9],
+        [12, 5, 1, 15, 14, 13, 4, 10, 0, 7, 6, 3, 9, 2, 8, 11],
+        [13, 11, 7, 14, 12, 1, 3, 9, 5, 0, 15, 4, 8, 6, 2, 10],
+        [6, 15, 14, 9, 11, 3, 0, 8, 12, 2, 13, 7, 1, 4, 10, 5],
+        [10, 2, 8, 4, 7, 6, 1, 5, 15, 11, 9, 14, 3, 12, 13, 0],
+    ]
+    G    : list[tuple[int, int, int, int]] = [(0, 4, 8, 12), (1, 5, 9, 13), (2, 6, 10, 14), (3, 7, 11, 15),
+                                              (0, 5, 10, 15), (1, 6, 11, 12), (2, 7, 8, 13), (3, 4, 9, 14)]
+
+    '''
+    BLAKE-256 (SHA-3 finalist, 14 rounds, no salt), used by circomlib to derive Pedersen generators
+    '''
+    @staticmethod
+    def digest(data: bytes) -> bytes:
+        mask   : int   = 0xFFFFFFFF
+        length : int   = len(data) * 8
+        padding: bytes = b'\x80' + b'\x00' * ((55 - len(data)) % 64)
+        padding = b'\x81' if 1 == len(padding) else padding[:-1] + b'\x01'
+        message: bytes = data + padding + length.to_bytes(8, byteorder='big')
+
+        h: list[int] = list(Blake256.IV)
+        for block in range(0, len(message) // 64):
+            # Counter of message bits so far, 0 if the block has padding only
+            counter: int       = min((block + 1) * 512, length) if block * 512 < length else 0
+            m      : list[int] = [int.from_bytes(message[block * 64 + i * 4:block * 64 + i * 4 + 4], byteorder='big') for i in range(0, 16)]
+            v      : list[int] = h + Blake256.C[:4] + [
+                (counter & mask) ^ Blake256.C[4], (counter & mask) ^ Blake256.C[5],
+                (counter >> 32) ^ Blake256.C[6], (counter >> 32) ^ Blake256.C[7],
+            ]
+            for r in range(0, 14):
+                sigma: list[int] = Blake256.SIGMA[r % 10]
+                for i, (a, b, c, d) in enumerate(Blake256.G):
+                    x, y = sigma[2 * i], sigma[2 * i + 1]
+                    v[a] = (v[a] + v[b] + (m[x] ^ Blake256.C[y])) & mask
+                    v[d] ^= v[a]
+                    v[d] = ((v[d] >> 16) | (v[d] << 16)) & mask
+                    v[c] = (v[c] + v[d]) & mask
+                    v[b] ^= v[c]
+                    v[b] = ((v[b] >> 12) | (v[b] << 20)) & mask
+                    v[a] = (v[a] + v[b] + (m[y] ^ Blake256.C[x])) & mask
+                    v[d] ^= v[a]
+                    v[d] = ((v[d] >> 8) | (v[d] << 24)) & mask
+                    v[c] = (v[c] + v[d]) & mask
+                    v[b] ^= v[c]
+                    v[b] = ((v[b] >> 7) | (v[b] << 25)) & mask
+            h = [h[i] ^ v[i] ^ v[i + 8] for i in range(0, 8)]
+
+        return b''.join(x.to_bytes(4, byteorder='big') for x in h)
+
+
+class BabyJubjub(object):
+
+    A        : int = 168700
+    D        : int = 168696
+    SUB_ORDER: int = 2736030358979909402780800718157159386076813972158567259200215660948447373041
+
+    '''
+    Add points in projective coordinates (X, Y, Z), complete for any two points
+    '''
+    @staticmethod
+    def add(p1: tuple[int, int, int], p2: tuple[int, int, int]) -> tuple[int, int, int]:
+        p: int = FIELD_SIZE
+        x1, y1, z1 = p1
+        x2, y2, z2 = p2
+        a: int = z1 * z2 % p
+        b: int = a * a % p
+        c: int = x1 * x2 % p
+        d: int = y1 * y2 % p
+        e: int = BabyJubjub.D * c * d % p
+        f: int = b - e
+        g: int = b + e
+        return a * f * ((x1 + y1) * (x2 + y2) - c - d) % p, a * g * (d - BabyJubjub.A * c) % p, f * g % p
+
+    @staticmethod
+    def affine(point: tuple[int, int, int]) -> tuple[int, int]:
+        z: int = pow(point[2], FIELD_SIZE - 2, FIELD_SIZE)
+        return point[0] * z % FIELD_SIZE, point[1] * z % FIELD_SIZE
+
+    @staticmethod
+    def mul(point: tuple[int, int], scalar: int) -> tuple[int, int]:
+        result: tuple[int, int, int] = (0, 1, 1)
+        base  : tuple[int, int, int] = (point[0], point[1], 1)
+        while scalar > 0:
+            if scalar & 1:
+                result = BabyJubjub.add(result, base)
+            base = BabyJubjub.add(base, base)
+            scalar >>= 1
+        return BabyJubjub.affine(result)
+
+    @staticmethod
+    def on_curve(point: tuple[int, int]) -> bool:
+        x2: int = point[0] * point[0] % FIELD_SIZE
+        y2: int = point[1] * point[1] % FIELD_SIZE
+        return (BabyJubjub.A * x2 + y2 - 1 - BabyJubjub.D * x2 * y2) % FIELD_SIZE == 0
+
+    '''
+    Square root in the field, the one not greater than (p - 1) / 2, same as ffjavascript
+    @return None if n is not a quadratic residue
+    '''
+    @staticmethod
+    def sqrt(n: int) -> int | None:
+        p: int = FIELD_SIZE
+        if 0 == n:
+            return 0
+        if pow(n, (p - 1) // 2, p) != 1:
+            return None
+        # Tonelli-Shanks, p - 1 = q * 2^s
+        q, s = p - 1, 0
+        while 0 == q % 2:
+            q, s = q // 2, s + 1
+        z: int = 2
+        while pow(z, (p - 1) // 2, p) != p - 1:
+            z += 1
+        m, c, t, r = s, pow(z, q, p), pow(n, q, p), pow(n, (q + 1) // 2, p)
+        while t != 1:
+            i, t2 = 0, t
+            while t2 != 1:
+                i, t2 = i + 1, t2 * t2 % p
+            b: int = pow(c, 1 << (m - i - 1), p)
+            m, c, t, r = i, b * b % p, t * b * b % p, r * b % p
+        return p - r if r > p >> 1 else r
+
+    '''
+    Unpack 32 bytes little-endian y with the sign of x in the highest bit, same as circomlib babyJub.unpackPoint()
+    @return None if not a point on the curve
+    '''
+    @staticmethod
+    def unpack(packed: bytes) -> tuple[int, int] | None:
+        buffer: bytearray = bytearray(packed)
+        sign  : int       = buffer[31] & 0x80
+        buffer[31] &= 0x7F
+        y: int = int.from_bytes(buffer, byteorder='little')
+        if y >= FIELD_SIZE:
+            return None
+        y2: int        = y * y % FIELD_SIZE
+        x : int | None = BabyJubjub.sqrt((1 - y2) * pow(BabyJubjub.A - BabyJubjub.D * y2, FIELD_SIZE - 2, FIELD_SIZE) % FIELD_SIZE)
+        if x is None:
+            return None
+        return (FIELD_SIZE - x) % FIELD_SIZE if sign else x, y
+
+
+class PedersenTable(object):
+
+    WINDOW_SIZE        : int = 4
+    WINDOWS_PER_SEGMENT: int = 50
+    ENTRIES            : int = 2 ** (WINDOW_SIZE - 1)  # Multiples 1..8 of each window, sign bit is a negation
+
+    '''
+    Fixed-base table of a segment generator G, entry [w * ENTRIES + k - 1] = k * 2^(5 * w) * G.
+    A segment of the circomlib Pedersen hash is then one table lookup and one point addition per window.
+    '''
+    def __init__(self, segment: int, entries: list[tuple[int, int]] | None = None) -> None:
+        self.segment: int                    = segment
+        self.entries: list[tuple[int, int]] = entries if entries is not None else self._build()
+
+    '''
+    Generator of segment, same as getBasePoint() of circomlib pedersenHash
+    '''
+    @staticmethod
+    def generator(segment: int) -> tuple[int, int]:
+        attempt: int = 0
+        while True:
+            seed  : bytes     = f'PedersenGenerator_{segment:032d}_{attempt:032d}'.encode()
+            digest: bytearray = bytearray(Blake256.digest(seed))
+            digest[31] &= 0xBF
+            point: tuple[int, int] | None = BabyJubjub.unpack(digest)
+            if point is not None:
+                point = BabyJubjub.mul(point, 8)
+                if BabyJubjub.mul(point, BabyJubjub.SUB_ORDER) != (0, 1):
+                    raise ValueError(f'Pedersen generator {segment} not in subgroup')
+                return point
+            attempt += 1
+
+    def _build(self) -> list[tuple[int, int]]:
+        x, y = PedersenTable.generator(self.segment)
+        base   : tuple[int, int, int]       = (x, y, 1)
+        entries: list[tuple[int, int, int]] = []
+        for _ in range(0, PedersenTable.WINDOWS_PER_SEGMENT):
+            multiple: tuple[int, int, int] = base
+            for _ in range(0, PedersenTable.ENTRIES):
+                entries.append(multiple)
+                multiple = BabyJubjub.add(multiple, base)
+            for _ in range(0, PedersenTable.WINDOW_SIZE + 1):
+                base = BabyJubjub.add(base, base)
+        return [BabyJubjub.affine(point) for point in entries]
+
+    def to_bytes(self) -> bytes:
+        return b''.join(x.to_bytes(32, byteorder='big') + y.to_bytes(32, byteorder='big') for x, y in self.entries)
+
+    '''
+    @return None if data is truncated or has a point not on the curve
+    '''
+    @staticmethod
+    def from_bytes(segment: int, data: bytes) -> 'PedersenTable | None':
+        if len(data) != PedersenTable.WINDOWS_PER_SEGMENT * PedersenTable.ENTRIES * 64:
+            return None
+        entries: list[tuple[int, int]] = [
+            (int.from_bytes(data[i:i + 32], byteorder='big'), int.from_bytes(data[i + 32:i + 64], byteorder='big'))
+            for i in range(0, len(data), 64)
+        ]
+        if not all(BabyJubjub.on_curve(point) for point in entries):
+            return None
+        return PedersenTable(segment, entries)
+
+
 class cpphash(object):
 
+    POSEIDON_PARAMS: dict[int, PoseidonParams] = {}  # {width: params}
+    PEDERSEN_TABLES: dict[int, PedersenTable]  = {}  # {segment: table}
+    PEDERSEN_CACHE : str                       = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Tmp', 'pedersen')
+
     def __init__(self):
         pass
 
     '''
+    Get Poseidon parameters of width t, generated once and reused
+    '''
+    @staticmethod
+    def poseidon_params(t: int) -> PoseidonParams:
+        params: PoseidonParams | None = cpphash.POSEIDON_PARAMS.get(t)
+        if params is None:
+            params = PoseidonParams(t)
+            cpphash.POSEIDON_PARAMS[t] = params
+        return params
+
+    '''
+    Poseidon over BN254 scalar field, compatible with circomlib Poseidon(n), 1 <= n <= 16
     @return (preimage, digest)
+    @raise  ValueError if number of preimages is out of range
     '''
     @staticmethod
     def poseidon(preimages: list[HexBytes]) -> tuple[HexBytes, HexBytes]:
-        pass
+        if not 1 <= len(preimages) <= len(PoseidonParams.PARTIAL_ROUNDS):
+            raise ValueError(f'Poseidon takes 1 to {len(PoseidonParams.PARTIAL_ROUNDS)} inputs, got {len(preimages)}')
+        inputs: list[int]      = [int.from_bytes(x, byteorder='big') % FIELD_SIZE for x in preimages]
+        params: PoseidonParams = cpphash.poseidon_params(len(inputs) + 1)
+        digest: int            = params.permute_pair(*inputs) if 2 == len(inputs) else params.permute(inputs)
+        return HexBytes(b''.join(bytes(x) for x in preimages)), HexBytes(digest.to_bytes(32, byteorder='big'))
 
     '''
-    @return (preimage, digest)
+    Hash many (left, right) pairs in one call, e.g. all dirty nodes of a merkle tree level.
+    Convenience wrapper over the width-3 permutation: the big integer arithmetic of each permutation dominates,
+    so skipping the per-call conversions of poseidon() is not measurably faster
+    @return [digest, ...] in the same order as pairs
+    '''
+    @staticmethod
+    def poseidon_many(pairs: list[tuple[HexBytes, HexBytes]]) -> list[HexBytes]:
+        permute_pair = cpphash.poseidon_params(3).permute_pair
+        return [
+            HexBytes(permute_pair(
+                int.from_bytes(left, byteorder='big') % FIELD_SIZE,
+                int.from_bytes(right, byteorder='big') % FIELD_SIZE,
+            ).to_bytes(32, byteorder='big'))
+            for left, right in pairs
+        ]
+
+    '''
+    Get Pedersen table of segment, from memory, then from PEDERSEN_CACHE on disk, otherwise build and save it
+    '''
+    @staticmethod
+    def pedersen_table(segment: int) -> PedersenTable:
+        table: PedersenTable | None = cpphash.PEDERSEN_TABLES.get(segment)
+        if table is not None:
+            return table
+
+        path: str = os.path.join(cpphash.PEDERSEN_CACHE, f'segment_{segment:04d}.bin')
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                table = PedersenTable.from_bytes(segment, f.read())
+        if table is None:
+            table = PedersenTable(segment)
+            try:
+                os.makedirs(cpphash.PEDERSEN_CACHE, exist_ok=True)
+                with open(f'{path}.tmp', 'wb') as f:
+                    f.write(table.to_bytes())
+                os.replace(f'{path}.tmp', path)
+            except OSError:
+                pass  # Cache is optional, keep the table in memory only
+
+        cpphash.PEDERSEN_TABLES[segment] = table
+        return table
+
+    '''
+    Pedersen hash on Baby Jubjub, same as circomlib pedersenHash, preimages are concatenated as bytes,
+    e.g. [nullifier, secret] as 31 bytes little-endian each for a Tornado commitment
+    @return (preimage, digest), digest is x of the resulting point, 32 bytes big-endian
     '''
     @staticmethod
     def pedersen(preimages: list[HexBytes]) -> tuple[HexBytes, HexBytes]:
-        pass
\ No newline at end of file
+        data        : bytes = b''.join(bytes(x) for x in preimages)
+        bits        : int   = len(data) * 8
+        message     : int   = int.from_bytes(data, byteorder='little')  # Bit i is bit i % 8 of byte i // 8
+        segment_bits: int   = PedersenTable.WINDOW_SIZE * PedersenTable.WINDOWS_PER_SEGMENT
+        p           : int   = FIELD_SIZE
+
+        # Sum of (+/-)(1 + 3 bits) * 2^(5 * w) * G over all windows, mixed addition with affine table entries
+        x, y, z = 0, 1, 1
+        for segment in range(0, (bits - 1) // segment_bits + 1):
+            entries: list[tuple[int, int]] = cpphash.pedersen_table(segment).entries
+            windows: int = min(PedersenTable.WINDOWS_PER_SEGMENT, (bits - segment * segment_bits - 1) // PedersenTable.WINDOW_SIZE + 1)
+            for window in range(0, windows):
+                nibble: int = (message >> (segment * segment_bits + window * PedersenTable.WINDOW_SIZE)) & 0xF
+                x2, y2 = entries[window * PedersenTable.ENTRIES + (nibble & 0x7)]
+                if nibble & 0x8:
+                    x2 = p - x2
+                b: int = z * z % p
+                c: int = x * x2 % p
+                d: int = y * y2 % p
+                e: int = BabyJubjub.D * c * d % p
+                f: int = b - e
+                g: int = b + e
+                x, y, z = z * f * ((x + y) * (x2 + y2) - c - d) % p, z * g * (d - BabyJubjub.A * c) % p, f * g % p
+
+        x = BabyJubjub.affine((x, y, z))[0]
+        return HexBytes(data), HexBytes(x.to_bytes(32, byteorder='big'))
+
+
+# Width 3 is used by every merkle tree node, generate it at import
+cpphash.poseidon_params(3)
\ No newline at end of file